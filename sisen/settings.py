@@ -43,6 +43,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'sisen.survey.cache.VersionsMiddleware',
 ]
 
 ROOT_URLCONF = 'sisen.urls'
@@ -168,6 +169,33 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Cache of per-class score matrices: 'locmem', 'file:<directory>' or an alias declared in CACHES.
+# Its entries and the in-process caches are keyed by version counters stored in the database, so a
+# per-process cache is never stale, only recomputed by each worker
+SCORE_MATRIX_CACHE = config('SCORE_MATRIX_CACHE', default='locmem')
+
+# Maximum number of per-student recommendation rankings kept in the memory of each process
+RECOMMENDATION_CACHE_SIZE = config('RECOMMENDATION_CACHE_SIZE', default=1024, cast=int)
+
+# Ranking of product recommendations: 'exact' cosine similarity, or 'quantized' to share the ranking
+# of profiles whose values (relative to their maximum) round to the same multiples of the step
+RECOMMENDATION_RANKING = config('RECOMMENDATION_RANKING', default='exact')
+RECOMMENDATION_QUANTIZATION_STEP = config('RECOMMENDATION_QUANTIZATION_STEP', default=0.05, cast=float)
+
+# Precomputed rankings (StudentRecommendation) older than this are not served; rebuild them nightly
+RECOMMENDATION_MAX_AGE_HOURS = config('RECOMMENDATION_MAX_AGE_HOURS', default=26, cast=int)
+# Precompute the rankings affected by a submission in a background thread, queuing at most
+# RECOMMENDATION_PRECOMPUTE_QUEUE_SIZE pending submissions per process
+RECOMMENDATION_PRECOMPUTE_ON_CHANGE = config('RECOMMENDATION_PRECOMPUTE_ON_CHANGE', default=True, cast=bool)
+RECOMMENDATION_PRECOMPUTE_QUEUE_SIZE = config('RECOMMENDATION_PRECOMPUTE_QUEUE_SIZE', default=1000, cast=int)
+
+# Collaborative filtering from ratings and favorites (compute_product_neighbors): weight of its term
+# added to the cosine score of the products of a student, neighbors kept per product and shrinkage
+# of the similarity of products rated together by few students
+COLLABORATIVE_WEIGHT = config('COLLABORATIVE_WEIGHT', default=0.1, cast=float)
+COLLABORATIVE_NEIGHBORS = config('COLLABORATIVE_NEIGHBORS', default=20, cast=int)
+COLLABORATIVE_SHRINKAGE = config('COLLABORATIVE_SHRINKAGE', default=10, cast=float)
+
 # Remove config or increase interval when in production
 JWT_AUTH = {
     'JWT_ALLOW_REFRESH': True,
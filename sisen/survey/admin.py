@@ -14,6 +14,10 @@ from .models import (
     StudentAnswer,
     FavoriteProduct,
     StudentAnswerLog,
+    StudentStudyScore,
+    ClassStudyAggregate,
+    StudentRecommendation,
+    ProductNeighbors,
     ClassProduct,
     Study,
     StudyOption,
@@ -195,6 +199,41 @@ class StudentAnswerLogAdmin(admin.ModelAdmin):
     date_hierarchy = "submit_datetime"
 
 
+@admin.register(StudentStudyScore)
+class StudentStudyScoreAdmin(admin.ModelAdmin):
+    list_display = ("student", "study", "study_option", "score")
+    list_filter = ("study", "study_option")
+    search_fields = ("student__user__email",)
+    readonly_fields = ("student", "study", "study_option", "score")
+
+
+@admin.register(ClassStudyAggregate)
+class ClassStudyAggregateAdmin(admin.ModelAdmin):
+    list_display = ("sclass", "study_option", "score_sum", "dominant_count", "answered_count")
+    list_filter = ("study", "sclass")
+    readonly_fields = ("sclass", "study", "study_option", "score_sum", "dominant_count", "answered_count")
+
+
+@admin.register(StudentRecommendation)
+class StudentRecommendationAdmin(admin.ModelAdmin):
+    list_display = (
+        "kind", "student", "sclass", "professor", "catalog_version", "profile_version", "computed_at"
+    )
+    list_filter = ("kind",)
+    search_fields = ("student__user__email", "professor__user__email")
+    readonly_fields = (
+        "student", "sclass", "professor", "kind", "ranking", "catalog_version", "profile_version",
+        "computed_at",
+    )
+
+
+@admin.register(ProductNeighbors)
+class ProductNeighborsAdmin(admin.ModelAdmin):
+    list_display = ("product", "computed_at")
+    search_fields = ("product__name",)
+    readonly_fields = ("product", "neighbors", "computed_at")
+
+
 @admin.register(EducationalType)
 class EducationalTypeAdmin(admin.ModelAdmin):
     list_display = ("name", "code", "description", "products_count")
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SurveyConfig(AppConfig):
     name = 'sisen.survey'
+
+    def ready(self):
+        import sisen.survey.signals
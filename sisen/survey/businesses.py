@@ -1,11 +1,29 @@
-from django.db.models import Sum, Max, F, FloatField
-from functools import reduce
+from django.db.models import Sum, Max, Count, F, Q, FloatField, IntegerField, Case, When, Value, \
+    Exists, OuterRef
+from collections import namedtuple
+from hashlib import sha1
+from rest_framework.renderers import JSONRenderer
+import numpy as np
+import sisen.survey.cache as cache
 import sisen.survey.dto as dto
 import sisen.survey.models as models
+import sisen.survey.serializers as serializers
 
 LEARNING_STYLES_ID = 1
 INTELLIGENCES_ID = 2
 
+# Process-wide caches of { study_id: (columns, max_scores) }, { study_id: { question_id: answer_ids } } and
+# { study_id: (questionnaire_json, etag) }, cleared by the signals registered in sisen.survey.signals.
+_study_options_max_scores_cache = {}
+_study_answer_ids_cache = {}
+_questionnaire_cache = {}
+
+# Process-wide (catalog_version, OptionVocabulary), also reset by clear_study_caches
+_option_vocabulary = None
+
+# Studies version the caches above were filled at: they are cleared when another process bumps it
+_study_caches_version = None
+
 def process_answer(study, student):
     submit_datetime = student.student_answer_logs.get(study=study).submit_datetime
     return dto.StudyWithMessageAndStudentOptionScore(
@@ -15,120 +33,451 @@ def process_answer(study, student):
         _calculate_student_score_by_study(study, student),
         [])
 
-def student_scores(study, student):
-    return dto.StudentWithOptionScore(
-        student.user,
-        _calculate_student_score_by_study(study, student))
+def scores_for_students(study, student_ids):
+    """
+    Looks up the persisted scores of many students at once with a single indexed query.
+
+    student_ids may be a list of ids or a values('id') queryset, in which case it is sent to the
+    database as a subquery. Returns a tuple (scores, rows, columns) where scores is a dense
+    matrix of percentual scores, rows maps each student id to its row and columns maps each
+    study option id to its column. Students that have not answered the study get no row.
+    """
+    columns, max_scores = _get_study_options_max_scores(study)
+    student_score_by_option = models.StudentStudyScore.objects.filter(
+        study=study,
+        student__in=student_ids
+    ).values(
+        'student_id', 'score', studyoption_id=F('study_option_id')
+    ).order_by('student_id')
+    scores, rows = _to_score_matrix(student_score_by_option, columns)
+    return scores, rows, columns
+
+def calculate_scores_for_students(study, student_ids):
+    """
+    Calculates the scores of many students from their raw answers with a single
+    GROUP BY (student, study_option) aggregate. Same arguments and result as scores_for_students.
+    """
+    columns, max_scores = _get_study_options_max_scores(study)
+    student_total_value_by_option = models.StudentAnswer.objects.filter(
+        study=study,
+        student__in=student_ids
+    ).values(
+        'student_id',
+        studyoption_id=F('question__study_option__id')
+    ).annotate(
+        score=Sum('answer__value')
+    ).order_by('student_id')
+    scores, rows = _to_score_matrix(student_total_value_by_option, columns)
+    return scores / max_scores, rows, columns
+
+def store_scores_for_students(study, student_ids):
+    """
+    Calculates the scores of the given students and persists them as StudentStudyScore rows,
+    replacing the ones previously stored. Must run inside the transaction that saved the answers.
+    """
+    study_id = getattr(study, 'id', study)
+    scores, rows, columns = calculate_scores_for_students(study_id, student_ids)
+    models.StudentStudyScore.objects.filter(study=study_id, student__in=student_ids).delete()
+    models.StudentStudyScore.objects.bulk_create([
+        models.StudentStudyScore(
+            student_id=student_id,
+            study_id=study_id,
+            study_option_id=option_id,
+            score=float(scores[row, col]))
+        for student_id, row in rows.items()
+        for option_id, col in columns.items()
+    ])
+    return scores, rows, columns
+
+def _to_score_matrix(student_score_by_option, columns):
+    rows = {}
+    totals = []
+    for item in student_score_by_option:
+        col = columns.get(item['studyoption_id'])
+        if col is not None:
+            row = rows.setdefault(item['student_id'], len(rows))
+            totals.append((row, col, item['score']))
+
+    scores = np.zeros((len(rows), len(columns)))
+    if totals:
+        row_idx, col_idx, values = zip(*totals)
+        scores[list(row_idx), list(col_idx)] = values
+    return scores, rows
+
+def scores_by_code(scores, columns, options):
+    """Turns one row of a scores_for_students matrix into a {study_option_code: score} dict."""
+    return {options[option_id].code: float(scores[col]) for option_id, col in columns.items()}
+
+def get_study_options(studies):
+    # Creates a dict like { studyoption_id1: studyoption1, ..., studyoption_idN: studyoptionN }
+    vocabulary = get_option_vocabulary()
+    return {so.id: so for study in studies for so in vocabulary.study_options(study)}
+
+class OptionVocabulary(object):
+    """
+    Every study option, read with one query: the options by id and by study (in id order) and the
+    sorted distinct option codes, which are the columns of the feature indexes and of the student
+    profiles, with the map from code to column.
+    """
+    Option = namedtuple('Option', 'id study_id code description')
+
+    def __init__(self, options):
+        self.options_by_id = {so.id: so for so in options}
+        self.codes = tuple(sorted({so.code for so in options}))
+        self.column_by_code = {code: column for column, code in enumerate(self.codes)}
+        options_by_study = {}
+        for so in options:
+            options_by_study.setdefault(so.study_id, []).append(so)
+        self._options_by_study = {study_id: tuple(sos) for study_id, sos in options_by_study.items()}
+
+    @classmethod
+    def load(cls):
+        return cls([cls.Option(*values) for values in models.StudyOption.objects.order_by('id').values_list(
+            'id', 'study_id', 'code', 'description')])
+
+    def study_options(self, study):
+        """Returns the options of a study (a Study or its id) in id order."""
+        return self._options_by_study.get(getattr(study, 'id', study), ())
+
+def get_option_vocabulary():
+    """Returns the OptionVocabulary of the process, loaded again when the catalog version changes."""
+    global _option_vocabulary
+    version = cache.get_catalog_version()
+    if _option_vocabulary is None or _option_vocabulary[0] != version:
+        _option_vocabulary = (version, OptionVocabulary.load())
+    return _option_vocabulary[1]
+
+def class_scores(study, sclass_id):
+    """
+    Returns the (scores, rows, columns, users) of the students of a class, as built by
+    scores_with_users_for_students, from the score-matrix cache. Entries are keyed by the class
+    version, which answer submissions and enrollment changes bump.
+    """
+    study_id = getattr(study, 'id', study)
+    key = 'class-scores:%s:%s:%s' % (sclass_id, study_id, cache.get_class_version(sclass_id))
+    entry = cache.get_cache().get(key)
+    if entry is None:
+        entry = scores_with_users_for_students(
+            study_id, models.Student.objects.filter(sclass=sclass_id).values('id'))
+        cache.get_cache().set(key, entry)
+    return entry
+
+def scores_with_users_for_students(study, student_ids):
+    """
+    Same as scores_for_students, with the users of the students joined in the same query. Returns
+    a tuple (scores, rows, columns, users) where users[row] is a dict with the student's
+    email, first_name and last_name.
+    """
+    columns, max_scores = _get_study_options_max_scores(study)
+    student_score_by_option = list(models.StudentStudyScore.objects.filter(
+        study=study,
+        student__in=student_ids
+    ).values(
+        'student_id', 'score',
+        studyoption_id=F('study_option_id'),
+        email=F('student__user__email'),
+        first_name=F('student__user__first_name'),
+        last_name=F('student__user__last_name')
+    ).order_by('student_id'))
+    scores, rows = _to_score_matrix(student_score_by_option, columns)
+    users = [None] * len(rows)
+    for item in student_score_by_option:
+        row = rows.get(item['student_id'])
+        if row is not None and users[row] is None:
+            users[row] = {
+                'email': item['email'],
+                'first_name': item['first_name'],
+                'last_name': item['last_name'],
+            }
+    return scores, rows, columns, users
+
+def class_student_profiles(sclass_id, codes):
+    """
+    Returns (student_ids, profiles, users) of the students of a class that answered both studies,
+    sorted by id, from the cached class scores: profiles[row] holds a student's scores with the
+    given option codes as columns and users[row] is as in scores_with_users_for_students.
+    """
+    styles, styles_rows, styles_columns, users = class_scores(LEARNING_STYLES_ID, sclass_id)
+    intelligences, intelligences_rows, intelligences_columns, _ = \
+        class_scores(INTELLIGENCES_ID, sclass_id)
+    student_ids, profiles = _profiles_by_code(
+        (styles, styles_rows, styles_columns),
+        (intelligences, intelligences_rows, intelligences_columns),
+        codes)
+    return student_ids, profiles, [users[styles_rows[id]] for id in student_ids]
+
+def student_profiles(student_ids, codes):
+    """
+    Same as class_student_profiles, without the users, for any students (a list of ids or a
+    values('id') queryset), looking up their stored scores.
+    """
+    return _profiles_by_code(
+        scores_for_students(LEARNING_STYLES_ID, student_ids),
+        scores_for_students(INTELLIGENCES_ID, student_ids),
+        codes)
+
+def _profiles_by_code(styles_matrix, intelligences_matrix, codes):
+    styles_rows, intelligences_rows = styles_matrix[1], intelligences_matrix[1]
+    student_ids = sorted(id for id in styles_rows if id in intelligences_rows)
+    vocabulary = get_option_vocabulary()
+    options = vocabulary.options_by_id
+    column_by_code = vocabulary.column_by_code if tuple(codes) == vocabulary.codes else \
+        {code: column for column, code in enumerate(codes)}
+
+    profiles = np.zeros((len(student_ids), len(codes)))
+    for scores, rows, columns in (styles_matrix, intelligences_matrix):
+        student_rows = [rows[id] for id in student_ids]
+        for option_id, column in columns.items():
+            code_column = column_by_code.get(options[option_id].code)
+            if code_column is not None:
+                profiles[:, code_column] = scores[student_rows, column]
+    return student_ids, profiles
+
+class ClassProfile(object):
+    """
+    Scores of the students of a set of classes that answered both studies: the total and mean
+    score by option code (of every option of both studies) and how many students they are.
+    """
+    def __init__(self, total_by_code, answered_count):
+        self.total_by_code = total_by_code
+        self.answered_count = answered_count
+
+    @property
+    def mean_by_code(self):
+        if not self.answered_count:
+            return {code: 0.0 for code in self.total_by_code}
+        return {code: total / self.answered_count for code, total in self.total_by_code.items()}
+
+    @classmethod
+    def for_classes(cls, sclass_ids):
+        """
+        Returns the profile of the given classes from the score-matrix cache, loading it with one
+        aggregate query when the version of any of the classes has changed.
+        """
+        sclass_ids = sorted(set(sclass_ids))
+        class_versions = cache.get_class_versions(sclass_ids)
+        versions = ','.join('%s.%s' % (id, class_versions[id]) for id in sclass_ids)
+        key = 'class-profile:%s' % sha1(versions.encode()).hexdigest()
+        profile = cache.get_cache().get(key)
+        if profile is None:
+            profile = cls.load(sclass_ids)
+            cache.get_cache().set(key, profile)
+        return profile
+
+    @classmethod
+    def load(cls, sclass_ids):
+        study_ids = [LEARNING_STYLES_ID, INTELLIGENCES_ID]
+        answered_both = models.StudentStudyScore.objects \
+            .filter(student__sclass__in=sclass_ids, study__in=study_ids) \
+            .values('student_id') \
+            .annotate(studies=Count('study_id', distinct=True)) \
+            .filter(studies=len(study_ids)) \
+            .values('student_id')
+        in_profile = Q(student_scores__student_id__in=answered_both)
+        options = models.StudyOption.objects \
+            .filter(study__in=study_ids) \
+            .annotate(total=Sum('student_scores__score', filter=in_profile),
+                      answered=Count('student_scores__student_id', filter=in_profile, distinct=True)) \
+            .values_list('code', 'total', 'answered')
+        total_by_code = {}
+        answered_count = 0
+        for code, total, answered in options:
+            total_by_code[code] = total or 0.0
+            answered_count = max(answered_count, answered)
+        return cls(total_by_code, answered_count)
 
 def professor_analytical_report(study, sclass):
-    student_with_option_score_dict = _get_student_by_option_max_score_dict(study, sclass)
+    scores, rows, columns, users = class_scores(study, sclass.id)
+    study_dto = {
+        'acronym': study.acronym,
+        'description': study.description,
+        'options': _group_by_dominant_option(study, scores, columns, users),
+    }
+    return {'study': study_dto, 'sclass': sclass}
 
-    study_option_dto_list = []
-    for so in models.StudyOption.objects.filter(study=study):
-        study_option_dto_list.append(
-            dto.StudyOptionWithStudentScore(
-                so,
-                student_with_option_score_dict.get(so.code, [])
-            )
-        )
-    study_dto = dto.StudyWithStudentStudyOptionScore(study, study_option_dto_list)
-    return dto.ProfessorAnalyticalReport(study_dto, sclass)
+def _group_by_dominant_option(study, scores, columns, users):
+    vocabulary = get_option_vocabulary()
+    options = vocabulary.study_options(study)
+    score_options = [vocabulary.options_by_id[option_id] for option_id in columns]
+    students_by_col = {}
+    if len(scores):
+        dominant = scores.argmax(axis=1)
+        order = np.argsort(dominant, kind='stable')
+        cols, starts = np.unique(dominant[order], return_index=True)
+        for col, group in zip(cols, np.split(order, starts[1:])):
+            students_by_col[col] = [{
+                'user': users[row],
+                'scores': [
+                    {'code': so.code, 'description': so.description, 'value': value}
+                    for so, value in zip(score_options, scores[row].tolist())
+                ],
+            } for row in group.tolist()]
+
+    return [{
+        'code': so.code,
+        'description': so.description,
+        'students': students_by_col.get(columns.get(so.id), []),
+    } for so in options]
 
 def professor_synthetic_report(study, sclass):
-    count_of_students_that_have_answered_study = models.StudentAnswer.objects \
-        .values(student_count=F('student__id')) \
-        .filter(student__sclass=sclass, study=study) \
-        .distinct() \
-        .count()
-    sum_of_students_study_option_score = {
-        item['studyoption_id']: item['score'] for item in
-            models.StudentAnswer.objects.values(
-                studyoption_id=F('question__study_option__id'),
-            ).annotate(
-                score=Sum('answer__value')
-            ).filter(
-                student__sclass=sclass,
-                study=study
-            )
+    aggregates = {
+        aggregate.study_option_id: aggregate for aggregate in
+            models.ClassStudyAggregate.objects.filter(sclass=sclass, study=study)
     }
-    study_options_max_scores = _multiply_max_scores_by_students_count(
-        study,
-        count_of_students_that_have_answered_study
-    )
-    student_with_option_score_dict = _get_student_by_option_max_score_dict(study, sclass)
     study_option_dto_list = []
-    for so in models.StudyOption.objects.filter(study=study):
+    for so in get_option_vocabulary().study_options(study):
+        aggregate = aggregates.get(so.id)
+        answered = aggregate is not None and aggregate.answered_count > 0
         study_option_dto_list.append(
             dto.StudyOptionScoreWithStudentCount(
                 so.code,
                 so.description,
-                _average_score(
-                    so.id,
-                    sum_of_students_study_option_score,
-                    study_options_max_scores
-                ),
-                len(student_with_option_score_dict.get(so.code, []))
+                aggregate.score_sum / aggregate.answered_count if answered else 0,
+                aggregate.dominant_count if answered else 0
             )
         )
     study_dto = dto.StudyWithAverageStudyOptionByClass(study, study_option_dto_list)
     return dto.ProfessorSyntheticReport(study_dto, sclass)
 
-def _get_student_by_option_max_score_dict(study, sclass):
-    student_with_option_score_dict = {}
-    for student in sclass.students.all():
-        student_with_option_score = student_scores(study, student)
-        if student_with_option_score.scores:
-            _add_or_update_list(student_with_option_score_dict,
-                max(student_with_option_score.scores,
-                    key=lambda score: score.value).code,
-                student_with_option_score)
-    return student_with_option_score_dict
-
-def _add_or_update_list(d, k, v):
-    c = d.get(k)
-    if c: c.append(v)
-    else: d[k] = [v]
+def update_class_aggregates(study, sclass_id, scores, columns, sign=1):
+    """
+    Adds (sign=1) or removes (sign=-1) the rows of a scores matrix to the running totals of a
+    class with a single UPDATE, creating the option rows of the class when they do not exist.
+    """
+    if not len(scores):
+        return
+    study_id = getattr(study, 'id', study)
+    score_sum = scores.sum(axis=0)
+    dominant_count = np.bincount(scores.argmax(axis=1), minlength=len(columns))
+    models.ClassStudyAggregate.objects.bulk_create([
+        models.ClassStudyAggregate(sclass_id=sclass_id, study_id=study_id, study_option_id=option_id)
+        for option_id in columns
+    ], ignore_conflicts=True)
+    models.ClassStudyAggregate.objects.filter(
+        sclass=sclass_id,
+        study=study_id
+    ).update(
+        score_sum=F('score_sum') + Case(
+            *[When(study_option_id=option_id, then=Value(sign * float(score_sum[col])))
+              for option_id, col in columns.items()],
+            default=Value(0.0), output_field=FloatField()),
+        dominant_count=F('dominant_count') + Case(
+            *[When(study_option_id=option_id, then=Value(sign * int(dominant_count[col])))
+              for option_id, col in columns.items()],
+            default=Value(0), output_field=IntegerField()),
+        answered_count=F('answered_count') + sign * len(scores)
+    )
+
+def move_student_class_aggregates(student_id, from_sclass_id, to_sclass_id):
+    for study in models.Study.objects.all():
+        scores, rows, columns = scores_for_students(study, [student_id])
+        if from_sclass_id is not None:
+            update_class_aggregates(study, from_sclass_id, scores, columns, sign=-1)
+        update_class_aggregates(study, to_sclass_id, scores, columns)
+
+def update_class_exclusive(*product_ids):
+    '''
+    Sets the is_class_exclusive flag of the given products to whether a ClassProduct links them to
+    a class, with one update.
+    '''
+    models.EducationalProduct.objects.filter(id__in=[id for id in product_ids if id is not None]).update(
+        is_class_exclusive=Exists(models.ClassProduct.objects.filter(product=OuterRef('pk'))))
+
+def rebuild_class_aggregates(sclasses):
+    for study in models.Study.objects.all():
+        for sclass in sclasses:
+            models.ClassStudyAggregate.objects.filter(sclass=sclass, study=study).delete()
+            scores, rows, columns = scores_for_students(study, sclass.students.values('id'))
+            update_class_aggregates(study, sclass.id, scores, columns)
 
 def _calculate_student_score_by_study(study, student):
-    # Creates a dict like { studyoption_id1: max_score1, ..., studyoption_idN: max_scoreN }
-    max_score_by_option = _get_study_options_max_scores(study)
-    student_total_value_by_option = models.StudentAnswer.objects.values(
-        studyoption_id=F('question__study_option__id'),
-        code=F('question__study_option__code'),
-        description=F('question__study_option__description')
-    ).annotate(
-        score=Sum('answer__value')
-    ).filter(
-          student=student,
-          study=study
-    )
-    scores = []
-    for item in student_total_value_by_option:
-        id = item.get('studyoption_id')
-        code = item.get('code')
-        description = item.get('description')
-        score = item.get('score')
-        percentual_score = score/max_score_by_option.get(id)
-        scores.append(dto.StudyOptionScore(code, description, percentual_score))
-    return scores
+    scores, rows, columns = scores_for_students(study, [student.id])
+    if student.id not in rows:
+        return []
+    return _to_study_option_scores(scores[rows[student.id]], columns, get_study_options([study]))
+
+def _to_study_option_scores(scores, columns, options):
+    return [dto.StudyOptionScore(options[option_id].code, options[option_id].description, float(scores[col]))
+            for option_id, col in columns.items()]
 
 def _get_study_options_max_scores(study):
+    """
+    Returns a tuple (columns, max_scores) where columns maps each study option id to its position
+    in the max_scores vector, which holds the highest total score a student can reach per option.
+    Options whose questions have no answers get 1 so the vector can always be used as a divisor.
+    """
+    study_id = getattr(study, 'id', study)
+    _sync_study_caches()
+    cached = _study_options_max_scores_cache.get(study_id)
+    if cached is None:
+        cached = _study_options_max_scores_cache[study_id] = _load_study_options_max_scores(study_id)
+    return cached
+
+def _load_study_options_max_scores(study_id):
     q = models.Question.objects.filter(
-        study=study
+        study=study_id
     ).values(
         'id', studyoption_id=F('study_option__id')
     ).annotate(
         max_score=Max('answers__value', output_field=FloatField())
     )
-    # iterates over sq items and generates a dict of the form {studyoption_id: max_score, ...}. Starts with an empty
-    # dict as accumulator and, for each item in sq, updates max_score in this accumulator summing the current item
-    # value to the already calculated one.
-    return reduce(lambda a, e:
-                  {**a, **{e.get('studyoption_id'): a.get(e.get('studyoption_id'), 0) + e.get('max_score')}},
-                  q, {})
-
-def _multiply_max_scores_by_students_count(study, count):
-    return { k: v * count for k, v in _get_study_options_max_scores(study).items() }
-
-def _average_score(study_option_id, sum_dict, max_dict):
-    return sum_dict.get(study_option_id, 0)/max_dict.get(study_option_id, 1)
+    # sums the max_score of every question of an option, generating a dict of the form {studyoption_id: max_score, ...}
+    max_score_by_option = {}
+    for item in q:
+        studyoption_id = item.get('studyoption_id')
+        max_score_by_option[studyoption_id] = max_score_by_option.get(studyoption_id, 0) + (item.get('max_score') or 0)
+
+    columns = {option_id: col for col, option_id in enumerate(sorted(max_score_by_option))}
+    max_scores = np.array([max_score_by_option[option_id] or 1 for option_id in columns], dtype=float)
+    max_scores.setflags(write=False)
+    return columns, max_scores
+
+def get_study_answer_ids(study):
+    """Returns a dict mapping each question id of the study to the frozenset of its valid answer ids."""
+    study_id = getattr(study, 'id', study)
+    _sync_study_caches()
+    cached = _study_answer_ids_cache.get(study_id)
+    if cached is None:
+        answer_ids = {question_id: set() for question_id in
+                      models.Question.objects.filter(study=study_id).values_list('id', flat=True)}
+        for question_id, answer_id in models.Answer.questions.through.objects.filter(
+                question__study=study_id).values_list('question_id', 'answer_id'):
+            answer_ids[question_id].add(answer_id)
+        cached = _study_answer_ids_cache[study_id] = {
+            question_id: frozenset(ids) for question_id, ids in answer_ids.items()}
+    return cached
+
+def questionnaire_payload(study):
+    """
+    Returns the questionnaire of a study as a precompiled JSON object (description and questions
+    with their answers, without links) and its ETag, derived from the content hash.
+    """
+    _sync_study_caches()
+    cached = _questionnaire_cache.get(study.id)
+    if cached is None:
+        payload = JSONRenderer().render({
+            'description': study.description,
+            'questions': serializers.QuestionSerializer(
+                study.questions.prefetch_related('answers'), many=True).data,
+        })
+        cached = _questionnaire_cache[study.id] = (payload, '"%s"' % sha1(payload).hexdigest())
+    return cached
+
+def clear_study_caches(study_id=None):
+    global _option_vocabulary
+    _option_vocabulary = None
+    if study_id is None:
+        _study_options_max_scores_cache.clear()
+        _study_answer_ids_cache.clear()
+        _questionnaire_cache.clear()
+    else:
+        _study_options_max_scores_cache.pop(study_id, None)
+        _study_answer_ids_cache.pop(study_id, None)
+        _questionnaire_cache.pop(study_id, None)
+
+def _sync_study_caches():
+    global _study_caches_version
+    version = cache.get_studies_version()
+    if version != _study_caches_version:
+        clear_study_caches()
+        _study_caches_version = version
@@ -0,0 +1,250 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F
+import sisen.survey.models as models
+
+_BACKEND_PARAMS = {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 10000}}
+
+_backend = None
+
+# Version counters read by the current request of the thread, see request_versions
+_local = threading.local()
+
+
+def get_cache():
+    """
+    Returns the cache configured by settings.SCORE_MATRIX_CACHE: 'locmem' for a per-process
+    memory cache, 'file:<directory>' for a file cache shared by the processes of a host, or the
+    alias of any backend declared in settings.CACHES (e.g. memcached, shared by every host).
+    Entries are keyed by version counters, which are shared whatever the backend.
+    """
+    global _backend
+    if _backend is None:
+        location = getattr(settings, 'SCORE_MATRIX_CACHE', 'locmem')
+        if location == 'locmem':
+            _backend = LocMemCache('sisen-score-matrix', _BACKEND_PARAMS)
+        elif location.startswith('file:'):
+            _backend = FileBasedCache(location[len('file:'):], _BACKEND_PARAMS)
+        else:
+            _backend = caches[location]
+    return _backend
+
+
+def get_version(name):
+    """
+    Returns the current value of a version counter. Counters are VersionCounter rows, shared by
+    every process; within a request (see request_versions) each one is read at most once. A
+    missing counter starts from the current time so it never repeats a value used before.
+    """
+    versions = getattr(_local, 'versions', None)
+    if versions is not None and name in versions:
+        return versions[name]
+    version = models.VersionCounter.objects.filter(name=name).values_list('value', flat=True).first()
+    if version is None:
+        counter, _ = models.VersionCounter.objects.get_or_create(
+            name=name, defaults={'value': time.time_ns()})
+        version = counter.value
+    if versions is not None:
+        versions[name] = version
+    return version
+
+
+def get_versions(names):
+    """
+    Returns { name: current value } of the given version counters like get_version, reading those
+    not yet read in the request with one query per 500 names.
+    """
+    versions = getattr(_local, 'versions', None)
+    found = {name: versions[name] for name in names if versions is not None and name in versions}
+    missing = [name for name in dict.fromkeys(names) if name not in found]
+    for start in range(0, len(missing), 500):
+        found.update(models.VersionCounter.objects.filter(
+            name__in=missing[start:start + 500]).values_list('name', 'value'))
+    for name in missing:
+        if name not in found:
+            found[name] = get_version(name)
+        elif versions is not None:
+            versions[name] = found[name]
+    return found
+
+
+def bump_version(name):
+    counters = models.VersionCounter.objects.filter(name=name)
+    if not counters.update(value=F('value') + 1):
+        _, created = models.VersionCounter.objects.get_or_create(
+            name=name, defaults={'value': time.time_ns()})
+        if not created:
+            counters.update(value=F('value') + 1)
+    versions = getattr(_local, 'versions', None)
+    if versions is not None:
+        versions.pop(name, None)
+
+
+@contextmanager
+def request_versions():
+    """
+    Keeps the version counters read in this thread until the block exits, so that a request reads
+    each of them once. Bumps made in the thread are seen at once; those of other processes are
+    seen from the next request on.
+    """
+    previous = getattr(_local, 'versions', None)
+    _local.versions = {}
+    try:
+        yield
+    finally:
+        _local.versions = previous
+
+
+class VersionsMiddleware:
+    """Runs each request within request_versions."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_versions():
+            return self.get_response(request)
+
+
+def get_class_version(sclass_id):
+    return get_version('class:%s' % sclass_id)
+
+
+def get_class_versions(sclass_ids):
+    """Returns { class id: version } of the given classes."""
+    versions = get_versions(['class:%s' % sclass_id for sclass_id in sclass_ids])
+    return {sclass_id: versions['class:%s' % sclass_id] for sclass_id in sclass_ids}
+
+
+def bump_class_versions(*sclass_ids):
+    for sclass_id in sclass_ids:
+        if sclass_id is not None:
+            bump_version('class:%s' % sclass_id)
+
+
+def get_student_version(student_id):
+    """
+    Version of a student's submissions, bumped when the student answers a study or changes class.
+    """
+    return get_version('student:%s' % student_id)
+
+
+def get_student_versions(student_ids):
+    """Returns { student id: version } of the given students."""
+    versions = get_versions(['student:%s' % student_id for student_id in student_ids])
+    return {student_id: versions['student:%s' % student_id] for student_id in student_ids}
+
+
+def bump_student_version(student_id):
+    bump_version('student:%s' % student_id)
+
+
+def get_scores_version():
+    """
+    Version of the stored scores of every student, bumped when recompute_scores or
+    backfill_student_scores rewrites them.
+    """
+    return get_version('scores')
+
+
+def bump_scores_version():
+    bump_version('scores')
+
+
+def get_catalog_version():
+    """
+    Version of everything a report or recommendation is built from besides the student answers:
+    studies and their options, educational types, products and methodologies.
+    """
+    return get_version('catalog')
+
+
+def bump_catalog_version():
+    bump_version('catalog')
+
+
+def get_studies_version():
+    """Version of the studies, their options, questions and answers."""
+    return get_version('studies')
+
+
+def bump_studies_version():
+    bump_version('studies')
+
+
+def get_feedback_version():
+    """
+    Version of the ratings, favorites and professor recommendations shown with the products.
+    """
+    return get_version('feedback')
+
+
+def bump_feedback_version():
+    bump_version('feedback')
+
+
+def get_student_feedback_version(student_id):
+    """Version of the ratings and favorites of a student."""
+    return get_version('feedback:%s' % student_id)
+
+
+def bump_student_feedback_version(student_id):
+    bump_version('feedback:%s' % student_id)
+
+
+def read_collaborative_versions(student_id):
+    """
+    Reads the versions of the student's ratings and favorites and of the neighbor lists with one
+    query, keeping them for the rest of the request.
+    """
+    get_versions(['feedback:%s' % student_id, 'neighbors'])
+
+
+def get_neighbors_version():
+    """
+    Version of the product neighbor lists of the collaborative filtering, bumped when recomputed.
+    """
+    return get_version('neighbors')
+
+
+def bump_neighbors_version():
+    bump_version('neighbors')
+
+
+class LRUCache:
+    """
+    Mapping of at most max_size entries kept in the memory of the process, evicting the least
+    recently used entry when full. Keys must embed the versions of what the values depend on.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,205 @@
+import json
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField, Value
+
+import sisen.survey.cache as cache
+import sisen.survey.models as models
+
+# Weight of each interaction of a student with a product, summed when there are several
+POSITIVE_WEIGHT = 1
+NEGATIVE_WEIGHT = -1
+FAVORITE_WEIGHT = 1
+
+# Process-wide (neighbors_version, { product_id: [(neighbor_id, similarity)] })
+_neighbor_lists = None
+
+# Interaction weights of the students keyed by (student_id, student feedback version)
+_interactions_cache = cache.LRUCache(settings.RECOMMENDATION_CACHE_SIZE)
+
+
+def interactions():
+    """
+    Returns the (student ids, product ids, weights) arrays of every rating and favorite, one entry
+    per interaction, with the weights above.
+    """
+    ratings = models.ProductRating.objects.values_list("student_id", "product_id", "rating")
+    favorites = models.FavoriteProduct.objects.values_list("student_id", "product_id")
+    entries = [
+        (student_id, product_id, _rating_weight(rating))
+        for student_id, product_id, rating in ratings
+    ]
+    entries.extend(
+        (student_id, product_id, FAVORITE_WEIGHT) for student_id, product_id in favorites
+    )
+    if not entries:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+    student_ids, product_ids, weights = (np.array(column) for column in zip(*entries))
+    return student_ids, product_ids, weights.astype(float)
+
+
+def item_similarities(rows, columns, weights, shape):
+    """
+    Returns the (columns, other columns, similarities) arrays of the pairs of distinct columns
+    that share a row of the sparse rows x columns matrix of the given entries: their cosine
+    similarity, shrunk towards 0 for columns that share few rows. Only the pairs of entries of a
+    same row are visited, so the cost grows with the co-rated pairs instead of columns squared.
+    """
+    # Sums repeated (row, column) entries and drops those that cancel out; cells sort by row
+    cells, inverse = np.unique(rows * shape[1] + columns, return_inverse=True)
+    values = np.bincount(inverse, weights=weights, minlength=len(cells))
+    present = values != 0
+    cells, values = cells[present], values[present]
+    rows, columns = cells // shape[1], cells % shape[1]
+    norms = np.sqrt(np.bincount(columns, weights=values ** 2, minlength=shape[1]))
+
+    # Every ordered pair of distinct entries of a row
+    starts = np.searchsorted(rows, rows)
+    counts = np.searchsorted(rows, rows, side="right") - starts
+    left = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    right = np.repeat(starts, counts) + np.arange(len(left)) - offsets
+    distinct = left != right
+    left, right = left[distinct], right[distinct]
+
+    pairs, inverse = np.unique(columns[left] * shape[1] + columns[right], return_inverse=True)
+    gram = np.bincount(inverse, weights=values[left] * values[right], minlength=len(pairs))
+    together = np.bincount(inverse, minlength=len(pairs))
+    first, second = pairs // shape[1], pairs % shape[1]
+    shrinkage = together / (together + settings.COLLABORATIVE_SHRINKAGE)
+    similarities = gram / (norms[first] * norms[second]) * shrinkage
+    return first, second, similarities
+
+
+def compute_neighbors():
+    """
+    Computes the neighbor lists of every product from the ratings and favorites of the students
+    and replaces the stored ones. Returns the number of products with neighbors.
+    """
+    student_ids, product_ids, weights = interactions()
+    students, rows = np.unique(student_ids, return_inverse=True)
+    products, columns = np.unique(product_ids, return_inverse=True)
+    first, second, similarities = item_similarities(
+        rows, columns, weights, (len(students), len(products))
+    )
+
+    # The most similar positive neighbors of each product, the lowest column first on ties
+    order = np.lexsort((second, -similarities, first))
+    order = order[similarities[order] > 0]
+    first, second, similarities = first[order], second[order], similarities[order]
+    kept = np.arange(len(first)) - np.searchsorted(first, first) < settings.COLLABORATIVE_NEIGHBORS
+    product_ids = products.tolist()
+    neighbor_lists = {}
+    for column, neighbor, similarity in zip(
+        first[kept].tolist(), second[kept].tolist(), similarities[kept].tolist()
+    ):
+        neighbor_lists.setdefault(product_ids[column], []).append(
+            (product_ids[neighbor], similarity)
+        )
+
+    with transaction.atomic():
+        models.ProductNeighbors.objects.all().delete()
+        models.ProductNeighbors.objects.bulk_create(
+            [
+                models.ProductNeighbors(product_id=product_id, neighbors=json.dumps(neighbors))
+                for product_id, neighbors in neighbor_lists.items()
+            ]
+        )
+        transaction.on_commit(cache.bump_neighbors_version)
+    return len(neighbor_lists)
+
+
+def get_neighbor_lists():
+    """Returns the stored neighbor lists by product id, loaded once per neighbors version."""
+    global _neighbor_lists
+    version = cache.get_neighbors_version()
+    if _neighbor_lists is None or _neighbor_lists[0] != version:
+        _neighbor_lists = (
+            version,
+            {
+                product_id: [tuple(pair) for pair in json.loads(neighbors)]
+                for product_id, neighbors in models.ProductNeighbors.objects.values_list(
+                    "product_id", "neighbors"
+                )
+            },
+        )
+    return _neighbor_lists[1]
+
+
+def student_interactions(student):
+    """
+    Returns the summed interaction weights of a student by product id, queried once per version
+    of the student's ratings and favorites.
+    """
+    key = (student.id, cache.get_student_feedback_version(student.id))
+    weights = _interactions_cache.get(key)
+    if weights is None:
+        weights = _query_interactions(student)
+        _interactions_cache.set(key, weights)
+    return weights
+
+
+def _query_interactions(student):
+    ratings = models.ProductRating.objects.filter(student=student).values_list(
+        "product_id", "rating"
+    )
+    favorites = models.FavoriteProduct.objects.filter(student=student).values_list(
+        "product_id", Value(None, output_field=IntegerField())
+    )
+    weights = {}
+    for product_id, rating in ratings.union(favorites, all=True):
+        weight = FAVORITE_WEIGHT if rating is None else _rating_weight(rating)
+        weights[product_id] = weights.get(product_id, 0) + weight
+    return weights
+
+
+def collaborative_scores(weights, product_ids):
+    """
+    Returns the collaborative term of each of the given products for a student with the given
+    interaction weights: the mean of the weights of the products the student interacted with,
+    weighted by their similarity to the product, from -1 to 1, or 0 with no similar product.
+    """
+    neighbor_lists = get_neighbor_lists()
+    totals, similarity_sums = {}, {}
+    for product_id, weight in weights.items():
+        for neighbor_id, similarity in neighbor_lists.get(product_id, ()):
+            totals[neighbor_id] = totals.get(neighbor_id, 0) + similarity * weight
+            similarity_sums[neighbor_id] = similarity_sums.get(neighbor_id, 0) + similarity
+    return np.array(
+        [
+            totals[product_id] / similarity_sums[product_id] if product_id in totals else 0
+            for product_id in product_ids
+        ]
+    )
+
+
+def blend_collaborative_scores(products, student):
+    """
+    Adds COLLABORATIVE_WEIGHT times the collaborative term of each product to its "score", within
+    0 and 1, and returns the products sorted by it, keeping the order of ties.
+    """
+    if settings.COLLABORATIVE_WEIGHT == 0 or not products:
+        return products
+    cache.read_collaborative_versions(student.id)
+    weights = student_interactions(student)
+    if not weights:
+        return products
+
+    terms = collaborative_scores(weights, [product["id"] for product in products])
+    if not terms.any():
+        return products
+    scores = np.clip(
+        np.array([product["score"] for product in products])
+        + settings.COLLABORATIVE_WEIGHT * terms,
+        0,
+        1,
+    )
+    for product, score in zip(products, scores.tolist()):
+        product["score"] = score
+    return [products[i] for i in np.argsort(-scores, kind="stable")]
+
+
+def _rating_weight(rating):
+    return POSITIVE_WEIGHT if rating == models.ProductRating.POSITIVE else NEGATIVE_WEIGHT
@@ -17,13 +17,6 @@ class AvailableStudy(object):
         self.links = links
 
 
-class SurveyAnswering(object):
-    def __init__(self, description, questions, links):
-        self.description = description
-        self.questions = questions
-        self.links = links
-
-
 class StudyOptionScore(object):
     def __init__(self, code, description, value):
         self.code = code
@@ -53,12 +46,6 @@ class AvailableClasses(object):
         self.links = links
 
 
-class StudentWithOptionScore(object):
-    def __init__(self, user, scores):
-        self.user = user
-        self.scores = scores
-
-
 class SyntheticReport(object):
     def __init__(self, sclass, study, students):
         self.sclass = sclass
@@ -84,23 +71,3 @@ class StudyOptionWithClassAverage(object):
         self.code = study_option.code
         self.description = study_option.description
         self.average = average
-
-
-class ProfessorAnalyticalReport(object):
-    def __init__(self, study, sclass):
-        self.study = study
-        self.sclass = sclass
-
-
-class StudyWithStudentStudyOptionScore(object):
-    def __init__(self, study, options):
-        self.acronym = study.acronym
-        self.description = study.description
-        self.options = options
-
-
-class StudyOptionWithStudentScore(object):
-    def __init__(self, study_option, students):
-        self.code = study_option.code
-        self.description = study_option.description
-        self.students = students
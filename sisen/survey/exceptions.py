@@ -1,18 +1,16 @@
 from rest_framework.exceptions import APIException
 
 class Conflict(APIException):
-    code = 'conflict'
     status_code = 409
-    detail = 'Conflict'
+    default_detail = 'Conflict'
+    default_code = 'conflict'
 
-    def __init__(self, detail):
-        Conflict.detail = detail
+class BadRequest(APIException):
+    status_code = 400
+    default_detail = 'Bad Request'
+    default_code = 'bad_request'
 
 class NotFound(APIException):
-    code = 'not_found'
     status_code = 404
-    detail = 'Not Found'
-
-    def __init__(self, detail):
-        if detail:
-            NotFound.detail = detail
+    default_detail = 'Not Found'
+    default_code = 'not_found'
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import sisen.survey.businesses as business
+import sisen.survey.cache as cache
+import sisen.survey.models as models
+import sisen.survey.recommendations as recommendations
+
+
+class Command(BaseCommand):
+    help = ('Persists the StudentStudyScore rows of the students that answered a study before they existed '
+            'and rebuilds the ClassStudyAggregate totals from them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of students scored per transaction.')
+        parser.add_argument('--all', action='store_true',
+                            help='Recalculate the students that already have stored scores too.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        scored_ids = set()
+        for study in models.Study.objects.all():
+            student_ids = models.StudentAnswer.objects.filter(
+                study=study
+            ).values_list('student_id', flat=True).distinct().order_by('student_id')
+            if not options['all']:
+                student_ids = student_ids.exclude(
+                    student__in=models.StudentStudyScore.objects.filter(study=study).values('student_id'))
+            student_ids = list(student_ids)
+            scored_ids.update(student_ids)
+
+            for start in range(0, len(student_ids), batch_size):
+                with transaction.atomic():
+                    business.store_scores_for_students(study, student_ids[start:start + batch_size])
+            self.stdout.write('%s: %i students scored' % (study.acronym, len(student_ids)))
+
+        with transaction.atomic():
+            business.rebuild_class_aggregates(models.Class.objects.all())
+        cache.bump_class_versions(*models.Class.objects.values_list('id', flat=True))
+        cache.bump_scores_version()
+        self.stdout.write('Class aggregates rebuilt')
+        # The rankings are recomputed live until precompute_recommendations stores them again
+        recommendations.discard(
+            scored_ids,
+            models.Student.objects.filter(id__in=scored_ids).values_list('sclass_id', flat=True).distinct())
@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+import sisen.survey.collaborative as collaborative
+
+
+class Command(BaseCommand):
+    help = ('Computes the most similar products of each product from the ratings and favorites of '
+            'the students (item-item collaborative filtering) into ProductNeighbors. Run it nightly.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = collaborative.compute_neighbors()
+        self.stdout.write(self.style.SUCCESS(
+            'Neighbors of %i products computed in %.1fs' % (count, time.monotonic() - started)))
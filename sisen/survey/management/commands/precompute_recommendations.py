@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+import sisen.survey.recommendations as recommendations
+
+
+class Command(BaseCommand):
+    help = ('Precomputes the ranked products and methodologies of the students, classes and '
+            'professors into StudentRecommendation. By default only the missing or stale rankings '
+            'are computed; run it with --all nightly for a full rebuild.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every ranking, not only the missing or stale ones.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of students scored by each matrix product.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        students, classes, professors = recommendations.precompute_all(
+            options['batch_size'], missing_only=not options['all'])
+        self.stdout.write(self.style.SUCCESS(
+            'Rankings of %i students, %i classes and %i professors precomputed in %.1fs' % (
+                students, classes, professors, time.monotonic() - started)))
@@ -0,0 +1,84 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_all_start_methods, get_context
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Max, Min
+import sisen.survey.businesses as business
+import sisen.survey.cache as cache
+import sisen.survey.models as models
+import sisen.survey.recommendations as recommendations
+
+
+def recompute_range(start_id, end_id):
+    """
+    Recalculates and stores the scores of the students with start_id <= id < end_id. Returns the
+    number of students that answered at least one study.
+    """
+    student_ids = models.Student.objects.filter(id__gte=start_id, id__lt=end_id).values('id')
+    scored_ids = set()
+    with transaction.atomic():
+        for study_id in models.Study.objects.values_list('id', flat=True):
+            _, rows, _ = business.store_scores_for_students(study_id, student_ids)
+            scored_ids.update(rows)
+    return len(scored_ids)
+
+
+class Command(BaseCommand):
+    help = ('Recalculates the stored scores of every student from their answers, e.g. after a '
+            'questionnaire weight change, splitting students in id ranges scored by a process pool.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Size of the student id range scored by each task.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes. 1 scores every chunk in this process.')
+
+    def handle(self, *args, **options):
+        bounds = models.Student.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write('No students to score')
+            return
+        chunk_size = options['chunk_size']
+        chunks = [(start, start + chunk_size)
+                  for start in range(bounds['first'], bounds['last'] + 1, chunk_size)]
+
+        workers = options['workers']
+        if workers > 1 and connections['default'].vendor == 'sqlite':
+            self.stdout.write('SQLite does not support concurrent writers, scoring in this process')
+            workers = 1
+        if workers > 1 and 'fork' not in get_all_start_methods():
+            # Spawned workers would import this module before Django is set up
+            self.stdout.write('Worker processes cannot be forked here, scoring in this process')
+            workers = 1
+
+        business.clear_study_caches()
+        started = time.monotonic()
+        total = 0
+        if workers > 1:
+            # Workers are forked: each one must open its own connection instead of sharing ours
+            connections.close_all()
+            with ProcessPoolExecutor(workers, mp_context=get_context('fork')) as executor:
+                futures = [executor.submit(recompute_range, *chunk) for chunk in chunks]
+                for done, future in enumerate(as_completed(futures), 1):
+                    total += future.result()
+                    self._progress(done, len(chunks), total, started)
+        else:
+            for done, chunk in enumerate(chunks, 1):
+                total += recompute_range(*chunk)
+                self._progress(done, len(chunks), total, started)
+
+        with transaction.atomic():
+            business.rebuild_class_aggregates(models.Class.objects.all())
+        cache.bump_class_versions(*models.Class.objects.values_list('id', flat=True))
+        cache.bump_scores_version()
+        # The rankings are recomputed live until precompute_recommendations stores them again
+        recommendations.discard_all()
+        self.stdout.write(self.style.SUCCESS(
+            '%i students scored in %.1fs' % (total, time.monotonic() - started)))
+
+    def _progress(self, done, chunks, total, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write('[%i/%i] %i students, %.1f students/sec' % (
+            done, chunks, total, total / elapsed if elapsed else 0))
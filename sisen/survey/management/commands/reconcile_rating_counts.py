@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+import sisen.survey.businesses as business
+import sisen.survey.cache as cache
+import sisen.survey.models as models
+
+
+class Command(BaseCommand):
+    help = ('Recounts the ratings of every educational product and repairs the pos_rating_count and '
+            'neg_rating_count counters that drifted, e.g. after ratings were edited in the admin, '
+            'and the is_class_exclusive flags, e.g. after bulk updates of the class products.')
+
+    def handle(self, *args, **options):
+        repaired = 0
+        with transaction.atomic():
+            # Locking the counters first waits for the ratings being registered, which update them
+            counters = list(models.EducationalProduct.objects.select_for_update().values_list(
+                'id', 'pos_rating_count', 'neg_rating_count'))
+            totals = {
+                total['product_id']: (total['positive'], total['negative'])
+                for total in models.ProductRating.objects.values('product_id').annotate(
+                    positive=Count('id', filter=Q(rating=models.ProductRating.POSITIVE)),
+                    negative=Count('id', filter=Q(rating=models.ProductRating.NEGATIVE)))
+            }
+            for product_id, positive, negative in counters:
+                expected = totals.get(product_id, (0, 0))
+                if (positive, negative) != expected:
+                    self.stdout.write('Product %i: %i/%i -> %i/%i' % (
+                        product_id, positive, negative, *expected))
+                    models.EducationalProduct.objects.filter(id=product_id).update(
+                        pos_rating_count=expected[0], neg_rating_count=expected[1])
+                    repaired += 1
+        self.stdout.write(self.style.SUCCESS('%i product rating counters repaired' % repaired))
+
+        with transaction.atomic():
+            drifted = list(models.EducationalProduct.objects.annotate(
+                linked=Exists(models.ClassProduct.objects.filter(product=OuterRef('pk')))
+            ).exclude(is_class_exclusive=F('linked')).values_list('id', flat=True))
+            if drifted:
+                business.update_class_exclusive(*drifted)
+                cache.bump_catalog_version()
+        for product_id in drifted:
+            self.stdout.write('Product %i: is_class_exclusive flipped' % product_id)
+        self.stdout.write(self.style.SUCCESS('%i product class-exclusive flags repaired' % len(drifted)))
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0013_classproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentStudyScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='study_scores', to='survey.Student')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='student_scores', to='survey.Study')),
+                ('study_option', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='student_scores', to='survey.StudyOption')),
+            ],
+            options={
+                'unique_together': {('student', 'study', 'study_option')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0014_studentstudyscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassStudyAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score_sum', models.FloatField(default=0)),
+                ('dominant_count', models.IntegerField(default=0)),
+                ('answered_count', models.IntegerField(default=0)),
+                ('sclass', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='study_aggregates', to='survey.Class')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='class_aggregates', to='survey.Study')),
+                ('study_option', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='class_aggregates', to='survey.StudyOption')),
+            ],
+            options={
+                'unique_together': {('sclass', 'study', 'study_option')},
+            },
+        ),
+    ]
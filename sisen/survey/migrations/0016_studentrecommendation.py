@@ -0,0 +1,38 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0015_classstudyaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentRecommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=64)),
+                ('ranking', models.TextField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('professor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='survey.Professor')),
+                ('sclass', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='survey.Class')),
+                ('student', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='survey.Student')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='studentrecommendation',
+            index=models.Index(fields=['student', 'kind'], name='survey_stud_student_c033d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentrecommendation',
+            index=models.Index(fields=['sclass', 'kind'], name='survey_stud_sclass__6c9bf4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentrecommendation',
+            index=models.Index(fields=['professor', 'kind'], name='survey_stud_profess_109c21_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0016_studentrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbors',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='neighbors', serialize=False, to='survey.EducationalProduct')),
+                ('neighbors', models.TextField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
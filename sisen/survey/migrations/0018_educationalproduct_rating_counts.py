@@ -0,0 +1,35 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:40
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_ratings(apps, schema_editor):
+    EducationalProduct = apps.get_model('survey', 'EducationalProduct')
+    ProductRating = apps.get_model('survey', 'ProductRating')
+    totals = ProductRating.objects.values('product_id').annotate(
+        positive=Count('id', filter=Q(rating=1)), negative=Count('id', filter=Q(rating=0)))
+    for total in totals:
+        EducationalProduct.objects.filter(id=total['product_id']).update(
+            pos_rating_count=total['positive'], neg_rating_count=total['negative'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0017_productneighbors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='educationalproduct',
+            name='neg_rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='educationalproduct',
+            name='pos_rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:43
+
+from django.db import migrations, models
+
+
+def flag_class_exclusive(apps, schema_editor):
+    EducationalProduct = apps.get_model('survey', 'EducationalProduct')
+    ClassProduct = apps.get_model('survey', 'ClassProduct')
+    EducationalProduct.objects.filter(
+        id__in=ClassProduct.objects.values('product_id')).update(is_class_exclusive=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0018_educationalproduct_rating_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='educationalproduct',
+            name='is_class_exclusive',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(flag_class_exclusive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0019_educationalproduct_is_class_exclusive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCounter',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField()),
+            ],
+        ),
+    ]
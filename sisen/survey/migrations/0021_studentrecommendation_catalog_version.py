@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-16 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0020_versioncounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentrecommendation',
+            name='catalog_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
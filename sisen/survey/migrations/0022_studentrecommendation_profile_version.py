@@ -0,0 +1,18 @@
+# Generated by Django 2.2.24 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0021_studentrecommendation_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentrecommendation',
+            name='profile_version',
+            field=models.CharField(default='', max_length=32),
+        ),
+    ]
@@ -141,6 +141,68 @@ class StudentAnswerLog(models.Model):
         unique_together = ("student", "study")
 
 
+class StudentStudyScore(models.Model):
+    student = models.ForeignKey(Student, on_delete=models.PROTECT, related_name='study_scores')
+    study = models.ForeignKey(Study, on_delete=models.PROTECT, related_name='student_scores')
+    study_option = models.ForeignKey(StudyOption, on_delete=models.PROTECT, related_name='student_scores')
+    score = models.FloatField()
+
+    def __str__(self):
+        return "%s: %s = %.4f" % (self.student.user.email, self.study_option.code, self.score)
+
+    class Meta:
+        unique_together = ("student", "study", "study_option")
+
+
+class ClassStudyAggregate(models.Model):
+    """
+    Running totals of the stored scores of the students of a class, one row per study option.
+    answered_count is the number of students of the class that answered the study and is the
+    same on every option row of a class and study.
+    """
+    sclass = models.ForeignKey(Class, on_delete=models.PROTECT, related_name='study_aggregates')
+    study = models.ForeignKey(Study, on_delete=models.PROTECT, related_name='class_aggregates')
+    study_option = models.ForeignKey(StudyOption, on_delete=models.PROTECT, related_name='class_aggregates')
+    score_sum = models.FloatField(default=0)
+    dominant_count = models.IntegerField(default=0)
+    answered_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "%s: %s" % (self.sclass, self.study_option)
+
+    class Meta:
+        unique_together = ("sclass", "study", "study_option")
+
+
+class StudentRecommendation(models.Model):
+    """
+    Precomputed ranking of one kind ('types', 'products:<type code>', 'methodologies' or
+    'methodologies:<type code>') for a student, a class or a professor (the other two are null),
+    stored as a JSON list of [id, score] pairs, best first. Rows are deleted when the answers of
+    their owners change and are only served while younger than
+    settings.RECOMMENDATION_MAX_AGE_HOURS, computed at the current catalog version and with the
+    profile_version (a digest of the version counters of the answers of the owner) still current.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, null=True, related_name='recommendations')
+    sclass = models.ForeignKey(Class, on_delete=models.CASCADE, null=True, related_name='recommendations')
+    professor = models.ForeignKey(Professor, on_delete=models.CASCADE, null=True, related_name='recommendations')
+    kind = models.CharField(max_length=64)
+    ranking = models.TextField()
+    catalog_version = models.BigIntegerField(default=0)
+    profile_version = models.CharField(max_length=32, default='')
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s: %s" % (self.student or self.sclass or self.professor, self.kind)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', 'kind']),
+            models.Index(fields=['sclass', 'kind']),
+            models.Index(fields=['professor', 'kind']),
+        ]
+
+
 class EducationalType(models.Model):
     code = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=255)
@@ -167,6 +229,12 @@ class EducationalProduct(models.Model):
     activity_type = models.CharField(max_length=255, default='')
     media_format = models.CharField(max_length=255, default='')
     educational_code = models.CharField(max_length=255, default='')
+    # Totals of the product's ratings, kept up to date by register_rating and repaired by the
+    # reconcile_rating_counts command
+    pos_rating_count = models.IntegerField(default=0)
+    neg_rating_count = models.IntegerField(default=0)
+    # Whether the product is linked to a class by a ClassProduct, kept up to date on their changes
+    is_class_exclusive = models.BooleanField(default=False, db_index=True)
     
     def __str__(self):
         if self.educational_code:
@@ -259,7 +327,35 @@ class FavoriteProduct(models.Model):
 
     class Meta:
         unique_together = ("student", "product")
-        
+
+
+class ProductNeighbors(models.Model):
+    """
+    Products most similar to a product by the students that rated or marked both as favorite, as a
+    JSON list of [product id, similarity] pairs, best first. Computed offline by
+    compute_product_neighbors.
+    """
+    product = models.OneToOneField(
+        EducationalProduct, on_delete=models.CASCADE, primary_key=True, related_name="neighbors"
+    )
+    neighbors = models.TextField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s: neighbors" % self.product.name
+
+
+class VersionCounter(models.Model):
+    """
+    Value of a version counter of sisen.survey.cache, stored here so that every process (web
+    workers and management commands) sees the bumps of the others.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        return "%s = %s" % (self.name, self.value)
+
 
 # Create a new model that will select educational products for each class
 class ClassProduct(models.Model):
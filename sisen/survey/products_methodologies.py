@@ -3,63 +3,494 @@ from sisen.survey.models import (
     EducationalProduct,
     LearningMethodology,
     LearningType,
-    StudyOption,
     ClassProduct,
     Class,
 )
 from collections import defaultdict
+from django.conf import settings
+from hashlib import sha1
+from math import ceil
 from random import sample
+from types import MappingProxyType
 import numpy as np
 from numpy.linalg import norm
-from sisen.survey.views.product_rating import (
-    get_positive_total_rating,
-    get_negative_total_rating,
-)
+import sisen.survey.cache as cache
+from sisen.survey.businesses import get_option_vocabulary
+from sisen.survey.views.product_rating import get_rating_totals
+
+# Process-wide { model: (catalog_version, FeatureIndex) }, rebuilt when the catalog version changes
+_feature_indexes = {}
+
+# Process-wide CatalogSnapshot, rebuilt when the catalog version changes
+_catalog = None
+
+
+class FeatureIndex:
+    """
+    0/1 matrix of catalog items (rows) by study option codes (columns), as is and L2-normalized,
+    with the maps from item id to row and from option code to column.
+    """
+
+    def __init__(self, ids, codes, features):
+        self.ids = list(ids)
+        self.codes = list(codes)
+        self.row_by_id = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.column_by_code = {code: column for column, code in enumerate(self.codes)}
+
+        matrix = np.zeros((len(self.ids), len(self.codes)))
+        for item_id, code in features:
+            if item_id in self.row_by_id and code in self.column_by_code:
+                matrix[self.row_by_id[item_id], self.column_by_code[code]] = 1
+        self.features = matrix
+        self.feature_counts = matrix.sum(axis=1)
+        norms = norm(matrix, axis=1, keepdims=True)
+        self.matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+        for array in (self.features, self.feature_counts, self.matrix):
+            array.flags.writeable = False
+
+    @classmethod
+    def for_model(cls, model):
+        """
+        Builds the index of a model with "styles" and "intelligences" relations to StudyOption.
+        """
+        features = []
+        for field_name in ("styles", "intelligences"):
+            field = getattr(model, field_name).field
+            features.extend(
+                field.remote_field.through.objects.values_list(
+                    "%s_id" % field.m2m_field_name(),
+                    "%s__code" % field.m2m_reverse_field_name(),
+                )
+            )
+        return cls(
+            model.objects.order_by("id").values_list("id", flat=True),
+            get_option_vocabulary().codes,
+            features,
+        )
+
+    def vector(self, reference_styles):
+        """Returns the scores by option code as a vector aligned with the columns."""
+        return np.array([reference_styles[code] for code in self.codes], dtype=float)
+
+    def scores(self, reference_styles):
+        """Returns the cosine similarity of every row to the given scores by option code."""
+        return self.similarities(self.vector(reference_styles))
+
+    def similarities(self, vector):
+        """Returns the cosine similarity of every row to a vector aligned with the columns."""
+        vector_norm = norm(vector)
+        if vector_norm == 0:
+            return np.zeros(len(self.ids))
+        return self.matrix @ (vector / vector_norm)
+
+    def similarity_matrix(self, profiles):
+        """Returns the cosine similarity of every row to every profile (rows of a matrix)."""
+        norms = norm(profiles, axis=1, keepdims=True)
+        return (
+            np.divide(profiles, norms, out=np.zeros_like(profiles), where=norms > 0)
+            @ self.matrix.T
+        )
+
+    def means(self, reference_styles):
+        """Returns the mean of the given scores by option code over the features of every row."""
+        totals = self.features @ self.vector(reference_styles)
+        return np.divide(
+            totals,
+            self.feature_counts,
+            out=np.zeros(len(self.ids)),
+            where=self.feature_counts > 0,
+        )
+
+
+def get_feature_index(model):
+    version = cache.get_catalog_version()
+    cached = _feature_indexes.get(model)
+    if cached is None or cached[0] != version:
+        cached = _feature_indexes[model] = (version, FeatureIndex.for_model(model))
+    return cached[1]
+
+
+def get_type_index():
+    return get_feature_index(EducationalType)
+
 
+def get_product_index():
+    return get_feature_index(EducationalProduct)
 
-def get_all_possible_styles_and_intelligences():
-    return sorted(StudyOption.objects.values_list("code", flat=True))
 
+def get_learning_type_index():
+    return get_feature_index(LearningType)
 
-def cosine_similarity(a, b):
-    div = norm(a) * norm(b)
-    if div == 0:
-        return 0
-    return np.dot(a, b) / div
 
+def get_methodology_index():
+    return get_catalog().methodology_index
 
-def sort_products_by_similarity(specific_products, reference_styles):
-    all_styles_and_intelligences = get_all_possible_styles_and_intelligences()
 
-    user_arr = np.array(
-        [
-            reference_styles[style_or_intelligence]
-            for style_or_intelligence in all_styles_and_intelligences
+class CatalogSnapshot:
+    """
+    Read-only copy of the catalog at a catalog version: the educational types, the educational
+    products, the learning types and the learning methodologies by type code, as mappings with
+    tuples of style and intelligence codes, the feature index of the methodologies and the ids of
+    the products linked to each class by type. Each relation is read with one query, and the get_*
+    functions return copies of the items.
+    """
+
+    def __init__(self, version):
+        self.version = version
+
+        styles, intelligences = _codes_by_item(EducationalType)
+        self.types = tuple(
+            _freeze(
+                {
+                    "id": et["id"],
+                    "name": et["name"],
+                    "description": et["description"],
+                    "code": et["code"],
+                    "styles": styles.get(et["id"], ()),
+                    "intelligences": intelligences.get(et["id"], ()),
+                }
+            )
+            for et in EducationalType.objects.order_by("id").values(
+                "id", "name", "description", "code"
+            )
+        )
+
+        styles, intelligences = _codes_by_item(EducationalProduct)
+        self.products_by_id = {
+            ep["id"]: _freeze(
+                dict(
+                    ep,
+                    styles=styles.get(ep["id"], ()),
+                    intelligences=intelligences.get(ep["id"], ()),
+                )
+            )
+            for ep in EducationalProduct.objects.values("id", "name", "info", "link")
+        }
+
+        styles, intelligences = _codes_by_item(LearningType)
+        self.learning_types = tuple(
+            _freeze(
+                {
+                    "id": lt["id"],
+                    "name": lt["name"],
+                    "description": lt["description"],
+                    "code": lt["code"],
+                    "learning_styles": styles.get(lt["id"], ()),
+                    "learning_intelligences": intelligences.get(lt["id"], ()),
+                }
+            )
+            for lt in LearningType.objects.order_by("id").values(
+                "id", "name", "description", "code"
+            )
+        )
+
+        self.type_ids_by_code = {et["code"].casefold(): et["id"] for et in self.types}
+
+        # The products linked to each class, by (class id, type id)
+        class_product_ids = defaultdict(list)
+        for class_id, type_id, product_id in ClassProduct.objects.order_by(
+            "product_id"
+        ).values_list("class_id_id", "product__type_id", "product_id"):
+            class_product_ids[class_id, type_id].append(product_id)
+        self.class_product_ids = {
+            key: tuple(product_ids) for key, product_ids in class_product_ids.items()
+        }
+
+        # Methodologies of the same type and name are one, with the id of the first
+        styles, intelligences = _codes_by_item(LearningMethodology)
+        by_type_and_name = defaultdict(dict)
+        for lm in LearningMethodology.objects.order_by("id").values(
+            "id", "name", "info", "link", "type__code"
+        ):
+            methodology = by_type_and_name[lm["type__code"].casefold()].setdefault(
+                lm["name"],
+                {
+                    "id": lm["id"],
+                    "name": lm["name"],
+                    "info": lm["info"],
+                    "link": lm["link"],
+                    "styles": {},
+                    "intelligences": {},
+                },
+            )
+            methodology["styles"].update(dict.fromkeys(styles.get(lm["id"], ())))
+            methodology["intelligences"].update(
+                dict.fromkeys(intelligences.get(lm["id"], ()))
+            )
+        self.methodologies_by_type = {
+            type_code: tuple(
+                _freeze(
+                    dict(
+                        methodology,
+                        styles=tuple(methodology["styles"]),
+                        intelligences=tuple(methodology["intelligences"]),
+                    )
+                )
+                for methodology in by_name.values()
+            )
+            for type_code, by_name in by_type_and_name.items()
+        }
+        # One row per merged methodology, with the features of all of its rows
+        merged = sorted(
+            (methodology["id"], methodology["styles"] + methodology["intelligences"])
+            for methodologies in self.methodologies_by_type.values()
+            for methodology in methodologies
+        )
+        self.methodology_index = FeatureIndex(
+            [methodology_id for methodology_id, _ in merged],
+            get_option_vocabulary().codes,
+            [(methodology_id, code) for methodology_id, codes in merged for code in codes],
+        )
+
+
+def get_catalog():
+    """Returns the catalog snapshot of the current catalog version, built on first use."""
+    global _catalog
+    version = cache.get_catalog_version()
+    if _catalog is None or _catalog.version != version:
+        _catalog = CatalogSnapshot(version)
+    return _catalog
+
+
+def refresh_catalog():
+    """Rebuilds the catalog snapshot, for rows committed before the catalog version was bumped."""
+    global _catalog
+    _catalog = CatalogSnapshot(cache.get_catalog_version())
+    return _catalog
+
+
+def _codes_by_item(model):
+    # ({ item_id: style codes }, { item_id: intelligence codes }) of a catalog model
+    codes = []
+    for field_name in ("styles", "intelligences"):
+        field = getattr(model, field_name).field
+        by_item = defaultdict(dict)
+        # In the order of the study options, as the catalog was always listed
+        through = field.remote_field.through.objects.order_by(
+            "%s_id" % field.m2m_reverse_field_name()
+        )
+        for item_id, code in through.values_list(
+            "%s_id" % field.m2m_field_name(),
+            "%s__code" % field.m2m_reverse_field_name(),
+        ):
+            by_item[item_id][code] = None
+        codes.append({item_id: tuple(item_codes) for item_id, item_codes in by_item.items()})
+    return codes
+
+
+def _freeze(item):
+    return MappingProxyType(item)
+
+
+def _thaw(item):
+    # A mutable copy of a snapshot item, with lists of codes
+    return {
+        key: list(value) if isinstance(value, tuple) else value for key, value in item.items()
+    }
+
+
+def quantize_profile(vector, step):
+    """
+    Returns the bucket of a profile vector: its values relative to its maximum (cosine similarity
+    does not depend on the scale) rounded to multiples of step, as the integer multiples.
+    """
+    peak = vector.max() if len(vector) else 0
+    if peak <= 0:
+        return (0,) * len(vector)
+    return tuple(np.rint(vector / peak / step).astype(int).tolist())
+
+
+def get_bucket_ranking(index, reference_styles, ids, context):
+    """
+    Returns the (id, score) pairs of the given rows of the index sorted by cosine similarity to the
+    center of the bucket of the reference scores. Rankings are computed once per bucket, context and
+    catalog version and kept in the shared cache, so the context must identify the set of ids.
+    """
+    step = settings.RECOMMENDATION_QUANTIZATION_STEP
+    bucket = quantize_profile(index.vector(reference_styles), step)
+    key = "bucket-ranking:%s:%s:%s" % (
+        cache.get_catalog_version(),
+        context,
+        sha1(repr((step, bucket)).encode()).hexdigest(),
+    )
+    ranking = cache.get_cache().get(key)
+    if ranking is None:
+        rows = [index.row_by_id[item_id] for item_id in ids]
+        scores = index.similarities(np.array(bucket, dtype=float))[rows]
+        ranking = [
+            (ids[i], scores[i].item()) for i in np.argsort(-scores, kind="stable")
         ]
+        cache.get_cache().set(key, ranking)
+    return ranking
+
+
+def get_ranking_context(product_name, class_object: Class = None):
+    """
+    Returns the context under which quantized rankings of the products of a type are shared: the
+    class when it curates the type, every class that does not otherwise. Returns None when
+    rankings are exact.
+    """
+    if settings.RECOMMENDATION_RANKING != "quantized":
+        return None
+    curated = bool(get_class_product_ids(product_name, class_object))
+    return "products:%s:%s" % (
+        product_name.casefold(),
+        class_object.id if curated else "generic",
     )
 
-    for product in specific_products:
-        product_styles_and_intelligences = product["styles"] + product["intelligences"]
-        product_arr = np.array(
-            [
-                1 if style_or_intelligence in product_styles_and_intelligences else 0
-                for style_or_intelligence in all_styles_and_intelligences
-            ]
+
+def sort_products_by_similarity(specific_products, reference_styles, index, context=None):
+    """
+    Sets the cosine similarity to the reference scores as the "score" of each product (rows of the
+    given index) and returns the products sorted by it, keeping the order of ties. With a ranking
+    context (see get_ranking_context) the ranking of the bucket of the reference scores is used.
+    """
+    if context is not None:
+        products_by_id = {product["id"]: product for product in specific_products}
+        ranking = get_bucket_ranking(
+            index, reference_styles, list(products_by_id), context
         )
-        product["score"] = cosine_similarity(user_arr, product_arr)
+        for product_id, score in ranking:
+            products_by_id[product_id]["score"] = score
+        return [products_by_id[product_id] for product_id, _ in ranking]
 
-    sorted_products = sorted(specific_products, key=lambda x: x["score"], reverse=True)
-    return sorted_products
+    rows = [index.row_by_id[product["id"]] for product in specific_products]
+    scores = index.scores(reference_styles)[rows]
+
+    for product, score in zip(specific_products, scores.tolist()):
+        product["score"] = score
+
+    order = np.argsort(-scores, kind="stable")
+    return [specific_products[i] for i in order]
+
+
+def top_rows(scores, count):
+    """
+    Returns the rows of the count highest scores, best first. Ties are ordered by row, and a tie at
+    the last selected position keeps the first rows, like a stable sort of the whole vector would.
+    """
+    count = max(0, min(count, len(scores)))
+    if count == 0:
+        return np.empty(0, dtype=int)
+    if count < len(scores):
+        kth_score = scores[np.argpartition(-scores, count - 1)[count - 1]]
+        above = np.flatnonzero(scores > kth_score)
+        ties = np.flatnonzero(scores == kth_score)[: count - len(above)]
+        rows = np.concatenate([above, ties])
+    else:
+        rows = np.arange(len(scores))
+    return rows[np.argsort(-scores[rows], kind="stable")]
+
+
+def recommended_count(total):
+    """The amount of recommended products is determined by the total number of products."""
+    return ceil(0.5 * total - 0.5)
+
+
+def get_recommended_products(recommendation):
+    """
+    Returns the educational types recommended for the given scores by option code, best first:
+    the recommended_count best types. Only those rows are selected and turned into dicts.
+    """
+    index = get_type_index()
+    count = recommended_count(len(index.ids))
+    if settings.RECOMMENDATION_RANKING == "quantized":
+        ranking = get_bucket_ranking(index, recommendation, index.ids, "types")[:count]
+    else:
+        scores = index.scores(recommendation)
+        ranking = [(index.ids[row], scores[row].item()) for row in top_rows(scores, count)]
+
+    return get_products_from_ranking(ranking)
+
+
+def get_products_from_ranking(ranking):
+    """
+    Returns the educational types of a list of (type id, score) pairs in its order, with the
+    score of each as its "score".
+    """
+    products_by_id = {
+        product["id"]: product
+        for product in get_products(ids=[type_id for type_id, _ in ranking])
+    }
+    selected_products = []
+    for type_id, score in ranking:
+        product = products_by_id[type_id]
+        product["score"] = score
+        selected_products.append(product)
+    return selected_products
+
+
+def sort_by_ranking(items, ranking):
+    """
+    Sets the scores of a list of (id, score) pairs as the "score" of the given dicts and returns
+    them in its order. Items missing from the ranking follow with score 0.
+    """
+    items_by_id = {item["id"]: item for item in items}
+    sorted_items = []
+    for item_id, score in ranking:
+        item = items_by_id.pop(item_id, None)
+        if item is not None:
+            item["score"] = score
+            sorted_items.append(item)
+    for item in items_by_id.values():
+        item["score"] = 0
+        sorted_items.append(item)
+    return sorted_items
+
+
+def get_recommended_products_for_profiles(profiles):
+    """
+    Returns the educational types recommended for each row of a matrix of profiles with the columns
+    of the type index, as get_recommended_products does for one profile, scoring every profile
+    with a single matrix product.
+    """
+    index = get_type_index()
+    count = recommended_count(len(index.ids))
+    rankings = [
+        [(index.ids[row], profile_scores[row].item()) for row in top_rows(profile_scores, count)]
+        for profile_scores in index.similarity_matrix(profiles)
+    ]
+
+    products_by_id = {
+        product["id"]: product
+        for product in get_products(
+            ids={type_id for ranking in rankings for type_id, _ in ranking}
+        )
+    }
+    return [
+        [dict(products_by_id[type_id], score=score) for type_id, score in ranking]
+        for ranking in rankings
+    ]
 
 
 def sort_methodologies_by_similarity(specific_methodologies, reference_styles):
-    raise NotImplementedError(
-        "Methodologies are not yet implemented with cosine similarity"
+    """
+    Sets the cosine similarity to the reference scores as the "score" of each learning methodology
+    and returns them sorted by it, keeping the order of ties.
+    """
+    return sort_products_by_similarity(
+        specific_methodologies, reference_styles, get_methodology_index()
     )
 
 
-def get_products_sorted_by_similarity_score(recommendation, products_list):
-    sorted_products = sort_products_by_similarity(products_list, recommendation)
+def get_learning_types_sorted_by_scores(reference_styles):
+    """
+    Returns the (learning type id, score) pairs of every learning type sorted by score, the score
+    being the mean of the reference scores over the options of the type divided by 100.
+    """
+    index = get_learning_type_index()
+    scores = index.means(reference_styles) / 100
+    return [
+        (index.ids[row], scores[row].item()) for row in top_rows(scores, len(scores))
+    ]
+
+
+def get_products_sorted_by_similarity_score(
+    recommendation, products_list, index, context=None
+):
+    sorted_products = sort_products_by_similarity(
+        products_list, recommendation, index, context
+    )
     return sorted_products
 
 
@@ -71,77 +502,75 @@ def get_specific_methodologies_by_scores(recommendation, methodology_name):
 
 
 def get_methodologies():
-    educational_types_raw = LearningType.objects.select_related(
-        "learning_styles", "learning_intelligences"
-    ).values(
-        "id", "code", "name", "description", "styles__code", "intelligences__code"
-    )
-
-    educational_types = defaultdict(
-        lambda: {"learning_styles": [], "learning_intelligences": []}
-    )
+    return [_thaw(learning_type) for learning_type in get_catalog().learning_types]
 
-    for et in educational_types_raw:
-        et_id = et["id"]
-        if "id" not in educational_types[et_id]:
-            educational_types[et_id].update(
-                {
-                    "id": et_id,
-                    "name": et["name"],
-                    "description": et["description"],
-                    "code": et["code"],
-                }
-            )
-        if et["styles__code"] not in educational_types[et_id]["learning_styles"]:
-            educational_types[et_id]["learning_styles"].append(et["styles__code"])
-        if (
-            et["intelligences__code"]
-            not in educational_types[et_id]["learning_intelligences"]
-        ):
-            educational_types[et_id]["learning_intelligences"].append(
-                et["intelligences__code"]
-            )
 
-    educational_types_list = list(educational_types.values())
-    return educational_types_list
+def get_products(class_id=None, ids=None):
+    """
+    Retrieves educational products (Types).
+    Returns ALL product types (Apps, Books, etc) regardless of class configuration, or only the
+    types of the given ids.
+    Filtering of content happens in get_specific_products_queryset.
+    """
+    types = get_catalog().types
+    if ids is not None:
+        ids = set(ids)
+        types = [et for et in types if et["id"] in ids]
+    return [_thaw(et) for et in types]
 
 
-def get_products(class_id=None):
+def get_specific_product_rows(product_name, class_object: Class = None):
     """
-    Retrieves educational products (Types).
-    Returns ALL product types (Apps, Books, etc) regardless of class configuration.
-    Filtering of content happens in get_specific_products.
+    Returns the compact "id", "name", "info" and rating counter dicts of the specific products of a
+    given type, as selected by get_specific_products_queryset, to rank, filter and sort them before
+    building the full dicts of a page of them with get_products_by_id.
     """
-    educational_types_raw = EducationalType.objects.select_related(
-        "styles", "intelligences"
-    ).values("id", "code", "name", "description", "styles__code", "intelligences__code")
+    return list(
+        get_specific_products_queryset(product_name, class_object).values(
+            "id", "name", "info", "pos_rating_count", "neg_rating_count"
+        )
+    )
 
-    educational_types = defaultdict(lambda: {"styles": [], "intelligences": []})
 
-    for et in educational_types_raw:
-        et_id = et["id"]
+def get_products_by_id(ids):
+    """Returns the dicts of the educational products of the given ids, by id."""
+    return {
+        product["id"]: product
+        for product in load_products(EducationalProduct.objects.filter(id__in=ids))
+    }
 
-        if "id" not in educational_types[et_id]:
-            educational_types[et_id].update(
-                {
-                    "id": et_id,
-                    "name": et["name"],
-                    "description": et["description"],
-                    "code": et["code"],
-                }
-            )
-        if et["styles__code"] not in educational_types[et_id]["styles"]:
-            educational_types[et_id]["styles"].append(et["styles__code"])
-        if et["intelligences__code"] not in educational_types[et_id]["intelligences"]:
-            educational_types[et_id]["intelligences"].append(et["intelligences__code"])
 
-    educational_types_list = list(educational_types.values())
-    return educational_types_list
+def load_products(queryset):
+    """
+    Returns the dicts of the educational products of a queryset with one query whatever their
+    number, for their ids and rating counters: the rest comes from the catalog snapshot.
+    """
+    counters = list(queryset.values_list("id", "pos_rating_count", "neg_rating_count"))
+    products_by_id = get_catalog().products_by_id
+    if any(product_id not in products_by_id for product_id, _, _ in counters):
+        products_by_id = refresh_catalog().products_by_id
+
+    products = []
+    for product_id, pos_rating, neg_rating in counters:
+        product = products_by_id[product_id]
+        products.append(
+            {
+                "id": product_id,
+                "name": product["name"],
+                "info": product["info"],
+                "link": product["link"],
+                "pos_rating": pos_rating,
+                "neg_rating": neg_rating,
+                "styles": list(product["styles"]),
+                "intelligences": list(product["intelligences"]),
+            }
+        )
+    return products
 
 
-def get_specific_products(product_name, class_object: Class = None):
+def get_specific_products_queryset(product_name, class_object: Class = None):
     """
-    Retrieves specific products of a given type (e.g. APPS) with Exclusivity Logic.
+    Selects the specific products of a given type (e.g. APPS) with Exclusivity Logic.
     
     1. If the class has specific links for this category:
        - Show ONLY those linked products (Curated View).
@@ -151,91 +580,48 @@ def get_specific_products(product_name, class_object: Class = None):
        - EXCLUDE any product that is linked to ANY other class.
        - This ensures custom products for Class A do not leak into Class B.
     """
-    qs = (
-        EducationalProduct.objects.select_related("type")
-        .prefetch_related("styles", "intelligences")
-        .filter(type__code__iexact=product_name)
-    )
-
-    is_curated_view = False
+    catalog = get_catalog()
+    type_id = catalog.type_ids_by_code.get(product_name.casefold())
+    if type_id is None:
+        return EducationalProduct.objects.none()
+    qs = EducationalProduct.objects.filter(type_id=type_id)
+
+    # Ids of the products this class linked for this product type, from the catalog snapshot
+    linked_ids = get_class_product_ids(product_name, class_object)
+
+    if linked_ids:
+        # EXCLUSIVE CURATED MODE: The professor curated this list. Show ONLY these.
+        qs = qs.filter(id__in=linked_ids)
+    else:
+        # DEFAULT / GENERIC MODE
+        # If we are not in a curated view (either no class provided or no links for this class),
+        # we must ensure we don't show "Private" products belonging to other classes:
+        # only "Public/Generic" products, the ones not linked to ANY class, are shown.
+        qs = qs.filter(is_class_exclusive=False)
 
-    if class_object:
-        # Check if there are specific links for THIS class and THIS product type
-        linked_ids = list(ClassProduct.objects.filter(
-            class_id=class_object.id,
-            product__type__code__iexact=product_name 
-        ).values_list('product_id', flat=True))
+    return qs
 
-        if linked_ids:
-            # EXCLUSIVE CURATED MODE: The professor curated this list. Show ONLY these.
-            qs = qs.filter(id__in=linked_ids)
-            is_curated_view = True
 
-    # DEFAULT / GENERIC MODE
-    if not is_curated_view:
-        # If we are not in a curated view (either no class provided or no links for this class),
-        # we must ensure we don't show "Private" products belonging to other classes.
-        
-        # Get IDs of ALL products that are linked to ANY class in the system
-        all_private_linked_ids = ClassProduct.objects.values_list('product_id', flat=True)
-        
-        # Exclude them. We only want "Public/Generic" products here.
-        qs = qs.exclude(id__in=all_private_linked_ids)
-
-    products = []
-    for product in qs:
-        products.append(
-            {
-                "id": product.id,
-                "name": product.name,
-                "info": product.info,
-                "link": product.link,
-                "pos_rating": get_positive_total_rating(product.id),
-                "neg_rating": get_negative_total_rating(product.id),
-                "styles": list(
-                    product.styles.values_list("code", flat=True)
-                ),
-                "intelligences": list(
-                    product.intelligences.values_list("code", flat=True)
-                ),
-            }
-        )
-    return products
+def get_class_product_ids(product_name, class_object: Class = None):
+    """Returns the ids of the products of a given type linked to a class, if any."""
+    if class_object is None:
+        return ()
+    catalog = get_catalog()
+    type_id = catalog.type_ids_by_code.get(product_name.casefold())
+    return catalog.class_product_ids.get((class_object.id, type_id), ())
 
 
 def get_specific_methodologies(product_name):
-    learning_methodologies_raw = LearningMethodology.objects.select_related(
-        "type", "styles", "intelligences"
-    ).values(
-        "id", "name", "info", "link", "type__code", "styles__code", "intelligences__code"
-    )
+    methodologies = get_catalog().methodologies_by_type.get(product_name.casefold(), ())
+    # The rating totals are looked up by the id of the methodology, as they always have been
+    rating_totals = get_rating_totals([methodology["id"] for methodology in methodologies])
 
-    learning_methodologies = defaultdict(lambda: {"styles": [], "intelligences": []})
-
-    for ep in learning_methodologies_raw:
-        if ep["type__code"].casefold() == product_name.casefold():
-            if ep["name"] not in learning_methodologies:
-                learning_methodologies[ep["name"]].update(
-                    {
-                        "id": ep["id"],
-                        "name": ep["name"],
-                        "info": ep["info"],
-                        "link": ep["link"],
-                        "pos_rating": get_positive_total_rating(ep["id"]),
-                        "neg_rating": get_negative_total_rating(ep["id"]),
-                    }
-                )
-            if ep["styles__code"] not in learning_methodologies[ep["name"]]["styles"]:
-                learning_methodologies[ep["name"]]["styles"].append(ep["styles__code"])
-            if (
-                ep["intelligences__code"]
-                not in learning_methodologies[ep["name"]]["intelligences"]
-            ):
-                learning_methodologies[ep["name"]]["intelligences"].append(
-                    ep["intelligences__code"]
-                )
-
-    learning_methodologies_list = list(learning_methodologies.values())
+    learning_methodologies_list = []
+    for methodology in methodologies:
+        pos_rating, neg_rating = rating_totals.get(methodology["id"], (0, 0))
+        learning_methodologies_list.append(
+            dict(_thaw(methodology), pos_rating=pos_rating, neg_rating=neg_rating)
+        )
     return learning_methodologies_list
 
 
@@ -246,13 +632,6 @@ def get_methodology_by_name(methodologies, methodology_name):
     return None
 
 
-def find_value_by_description2(objects, target_code):
-    for obj in objects:
-        if obj == target_code:
-            return objects[obj]
-    return None
-
-
 def add_score_to_methodology(methodology, score):
     methodology["score"] = score
     return methodology
\ No newline at end of file
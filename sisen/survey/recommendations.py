@@ -0,0 +1,370 @@
+import hashlib
+import json
+import logging
+import queue
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+import sisen.survey.businesses as business
+import sisen.survey.cache as cache
+import sisen.survey.models as models
+from sisen.survey.products_methodologies import (
+    get_type_index,
+    get_product_index,
+    get_methodology_index,
+    get_learning_types_sorted_by_scores,
+    get_specific_products_queryset,
+    get_specific_methodologies,
+)
+
+logger = logging.getLogger(__name__)
+
+TYPES = "types"
+METHODOLOGIES = "methodologies"
+
+# Precomputations queued by invalidate, run one at a time by a worker thread of the process
+_queue = queue.Queue(maxsize=settings.RECOMMENDATION_PRECOMPUTE_QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def products_kind(product_type):
+    return "products:%s" % product_type.casefold()
+
+
+def methodologies_kind(methodology_type):
+    return "methodologies:%s" % methodology_type.casefold()
+
+
+def get_stored_ranking(kind, student=None, sclass=None, professor=None):
+    """
+    Returns the stored ranking of the given kind of a student, a class or a professor as a list
+    of (id, score) pairs, or None when there is none younger than RECOMMENDATION_MAX_AGE_HOURS
+    computed at the current catalog version and from the current answers of its owner.
+    """
+    owner_field, owner = next(
+        (field, owner)
+        for field, owner in (("student", student), ("sclass", sclass), ("professor", professor))
+        if owner is not None
+    )
+    ranking = (
+        _fresh()
+        .filter(
+            kind=kind,
+            student=student,
+            sclass=sclass,
+            professor=professor,
+            profile_version=_profile_versions(owner_field, [owner.id])[owner.id],
+        )
+        .values_list("ranking", flat=True)
+        .first()
+    )
+    if ranking is None:
+        return None
+    return [tuple(pair) for pair in json.loads(ranking)]
+
+
+def precompute_students(student_ids):
+    """
+    Stores the type ranking and the product ranking of every type of the given students that
+    answered both studies, scoring all of them with one matrix product per index.
+    """
+    catalog_version = cache.get_catalog_version()
+    profile_versions = _profile_versions("student", student_ids)
+    type_index, product_index = get_type_index(), get_product_index()
+    # Both indexes have every study option code as columns
+    student_ids, profiles = business.student_profiles(student_ids, type_index.codes)
+    type_scores = type_index.similarity_matrix(profiles)
+    product_scores = product_index.similarity_matrix(profiles)
+
+    sclass_id_by_student = dict(
+        models.Student.objects.filter(id__in=student_ids).values_list("id", "sclass_id")
+    )
+    classes = models.Class.objects.in_bulk(set(sclass_id_by_student.values()))
+    type_codes = list(models.EducationalType.objects.values_list("code", flat=True))
+    product_ids = {}
+
+    rankings = {}
+    for row, student_id in enumerate(student_ids):
+        sclass = classes[sclass_id_by_student[student_id]]
+        by_kind = {TYPES: _rank(type_index, type_scores[row], type_index.ids)}
+        for code in type_codes:
+            if (sclass.id, code) not in product_ids:
+                product_ids[sclass.id, code] = list(
+                    get_specific_products_queryset(code, sclass).values_list("id", flat=True)
+                )
+            by_kind[products_kind(code)] = _rank(
+                product_index, product_scores[row], product_ids[sclass.id, code]
+            )
+        rankings[student_id] = by_kind
+    _store("student", rankings, catalog_version, profile_versions)
+    return len(rankings)
+
+
+def precompute_classes(class_ids):
+    """Stores the type and product rankings of the mean profile of each of the given classes."""
+    catalog_version = cache.get_catalog_version()
+    profile_versions = _profile_versions("sclass", class_ids)
+    type_index, product_index = get_type_index(), get_product_index()
+    type_codes = list(models.EducationalType.objects.values_list("code", flat=True))
+
+    rankings = {}
+    for sclass in models.Class.objects.filter(id__in=class_ids):
+        # Loaded rather than cached: this may run before the class versions are bumped
+        profile = business.ClassProfile.load([sclass.id])
+        rankings[sclass.id] = {}
+        if profile.answered_count == 0:
+            continue
+        mean_by_code = profile.mean_by_code
+        type_scores = type_index.scores(mean_by_code)
+        product_scores = product_index.scores(mean_by_code)
+        rankings[sclass.id][TYPES] = _rank(type_index, type_scores, type_index.ids)
+        for code in type_codes:
+            rankings[sclass.id][products_kind(code)] = _rank(
+                product_index,
+                product_scores,
+                get_specific_products_queryset(code, sclass).values_list("id", flat=True),
+            )
+    _store("sclass", rankings, catalog_version, profile_versions)
+    return len(rankings)
+
+
+def precompute_professors(professor_ids):
+    """
+    Stores the methodology rankings and the (class independent) product rankings of the mean
+    profile of the classes of each of the given professors.
+    """
+    catalog_version = cache.get_catalog_version()
+    profile_versions = _profile_versions("professor", professor_ids)
+    product_index, methodology_index = get_product_index(), get_methodology_index()
+    type_codes = list(models.EducationalType.objects.values_list("code", flat=True))
+    methodology_codes = list(models.LearningType.objects.values_list("code", flat=True))
+
+    rankings = {}
+    for professor in models.Professor.objects.filter(id__in=professor_ids).prefetch_related(
+        "classes"
+    ):
+        profile = business.ClassProfile.load([sclass.id for sclass in professor.classes.all()])
+        rankings[professor.id] = {}
+        if profile.answered_count == 0:
+            continue
+        mean_by_code = profile.mean_by_code
+        product_scores = product_index.scores(mean_by_code)
+        methodology_scores = methodology_index.scores(mean_by_code)
+        rankings[professor.id][METHODOLOGIES] = get_learning_types_sorted_by_scores(
+            profile.total_by_code
+        )
+        for code in type_codes:
+            rankings[professor.id][products_kind(code)] = _rank(
+                product_index,
+                product_scores,
+                get_specific_products_queryset(code).values_list("id", flat=True),
+            )
+        for code in methodology_codes:
+            rankings[professor.id][methodologies_kind(code)] = _rank(
+                methodology_index,
+                methodology_scores,
+                [methodology["id"] for methodology in get_specific_methodologies(code)],
+            )
+    _store("professor", rankings, catalog_version, profile_versions)
+    return len(rankings)
+
+
+def precompute(student_ids=(), class_ids=(), professor_ids=()):
+    if student_ids:
+        precompute_students(student_ids)
+    if class_ids:
+        precompute_classes(class_ids)
+    if professor_ids:
+        precompute_professors(professor_ids)
+
+
+def answered_student_ids():
+    """Returns a values_list of the ids of the students that answered both studies."""
+    study_ids = [business.LEARNING_STYLES_ID, business.INTELLIGENCES_ID]
+    return (
+        models.StudentAnswerLog.objects.filter(study__in=study_ids)
+        .values("student_id")
+        .annotate(studies=Count("study_id", distinct=True))
+        .filter(studies=len(study_ids))
+        .values_list("student_id", flat=True)
+        .order_by("student_id")
+    )
+
+
+def precompute_all(batch_size=500, missing_only=False):
+    """
+    Precomputes the rankings of every student that answered both studies, every class and every
+    professor, in batches of batch_size students. With missing_only, only the owners without a
+    fresh ranking are precomputed. Returns the (students, classes, professors) counts.
+    """
+    student_ids = list(answered_student_ids())
+    class_ids = list(models.Class.objects.values_list("id", flat=True))
+    professor_ids = list(models.Professor.objects.values_list("id", flat=True))
+    if missing_only:
+        student_ids = _missing(student_ids, "student")
+        class_ids = _missing(class_ids, "sclass")
+        professor_ids = _missing(professor_ids, "professor")
+
+    students = 0
+    for start in range(0, len(student_ids), batch_size):
+        students += precompute_students(student_ids[start : start + batch_size])
+    return students, precompute_classes(class_ids), precompute_professors(professor_ids)
+
+
+def discard(student_ids=(), class_ids=(), professor_ids=()):
+    """
+    Deletes the rankings of the given students, classes and professors and of the professors of
+    the classes. Returns the (student ids, class ids, professor ids) whose rankings were deleted.
+    """
+    student_ids = list(student_ids)
+    class_ids = [id for id in class_ids if id is not None]
+    professor_ids = set(professor_ids)
+    professor_ids.update(
+        models.Professor.classes.through.objects.filter(class_id__in=class_ids).values_list(
+            "professor_id", flat=True
+        )
+    )
+    models.StudentRecommendation.objects.filter(
+        Q(student__in=student_ids) | Q(sclass__in=class_ids) | Q(professor__in=professor_ids)
+    ).delete()
+    return student_ids, class_ids, list(professor_ids)
+
+
+def discard_all():
+    """Deletes every ranking, e.g. after the stored scores of every student were recalculated."""
+    models.StudentRecommendation.objects.all().delete()
+
+
+def invalidate(student_ids=(), class_ids=(), professor_ids=()):
+    """
+    Discards the rankings of the given students, classes and professors and of the professors of
+    the classes, and queues their precomputation after the current transaction commits. The
+    versions of the changed answers must be bumped by on_commit callbacks registered before.
+    """
+    args = discard(student_ids, class_ids, professor_ids)
+    if settings.RECOMMENDATION_PRECOMPUTE_ON_CHANGE:
+        transaction.on_commit(lambda: _enqueue(*args))
+
+
+def _enqueue(*args):
+    # Queues a precomputation for the worker thread, off the request that triggered it. When the
+    # queue is full it is dropped: the rankings are computed live until precompute_recommendations
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="recommendations", daemon=True)
+            _worker.start()
+    try:
+        _queue.put_nowait(args)
+    except queue.Full:
+        logger.warning("Recommendation precomputation queue full, dropping %s", args)
+
+
+def _work():
+    while True:
+        args = _queue.get()
+        try:
+            precompute(*args)
+        except Exception:
+            logger.exception("Recommendation precomputation failed")
+        finally:
+            connection.close()
+
+
+def _profile_versions(owner_field, owner_ids):
+    # { owner id: digest of the versions its ranking is computed from }: the stored scores and the
+    # submissions of the student, of the class, or of each class of the professor
+    scores_version = cache.get_scores_version()
+    if owner_field == "student":
+        versions = cache.get_student_versions(owner_ids)
+        return {owner_id: _digest(scores_version, versions[owner_id]) for owner_id in owner_ids}
+    if owner_field == "sclass":
+        versions = cache.get_class_versions(owner_ids)
+        return {owner_id: _digest(scores_version, versions[owner_id]) for owner_id in owner_ids}
+
+    class_ids = {owner_id: [] for owner_id in owner_ids}
+    for professor_id, class_id in (
+        models.Professor.classes.through.objects.filter(professor_id__in=owner_ids)
+        .values_list("professor_id", "class_id")
+        .order_by("class_id")
+    ):
+        class_ids[professor_id].append(class_id)
+    versions = cache.get_class_versions({id for ids in class_ids.values() for id in ids})
+    return {
+        owner_id: _digest(scores_version, *((id, versions[id]) for id in class_ids[owner_id]))
+        for owner_id in owner_ids
+    }
+
+
+def _digest(*versions):
+    return hashlib.md5(repr(versions).encode()).hexdigest()
+
+
+def _fresh():
+    # The rankings that may be served: recent enough and computed from the current catalog
+    oldest = timezone.now() - timedelta(hours=settings.RECOMMENDATION_MAX_AGE_HOURS)
+    return models.StudentRecommendation.objects.filter(
+        computed_at__gte=oldest, catalog_version=cache.get_catalog_version()
+    )
+
+
+def _missing(owner_ids, owner_field):
+    # The given owners without a fresh ranking computed from their current answers
+    profile_versions = _profile_versions(owner_field, owner_ids)
+    fresh = set(
+        _fresh()
+        .filter(**{"%s__in" % owner_field: owner_ids})
+        .values_list("%s_id" % owner_field, "profile_version")
+    )
+    return [
+        owner_id
+        for owner_id in owner_ids
+        if (owner_id, profile_versions[owner_id]) not in fresh
+    ]
+
+
+def _rank(index, scores, ids):
+    # Ranks the given ids of the index by their score, keeping their order on ties
+    ids = list(ids)
+    item_scores = scores[[index.row_by_id[item_id] for item_id in ids]]
+    return [
+        (ids[i], item_scores[i].item()) for i in np.argsort(-item_scores, kind="stable")
+    ]
+
+
+def _store(owner_field, rankings, catalog_version, profile_versions):
+    # Replaces the rankings of the owners, { owner_id: { kind: ranking } }, computed at the given
+    # { owner_id: profile version }. Owners whose versions moved since are skipped: their newer
+    # answers discarded their rankings and queued them again
+    with transaction.atomic():
+        # Read again, not from the versions already read in this thread
+        with cache.request_versions():
+            current = _profile_versions(owner_field, list(rankings))
+        rankings = {
+            owner_id: by_kind
+            for owner_id, by_kind in rankings.items()
+            if current[owner_id] == profile_versions[owner_id]
+        }
+        models.StudentRecommendation.objects.filter(
+            **{"%s__in" % owner_field: list(rankings)}
+        ).delete()
+        models.StudentRecommendation.objects.bulk_create(
+            [
+                models.StudentRecommendation(
+                    kind=kind,
+                    ranking=json.dumps(ranking),
+                    catalog_version=catalog_version,
+                    profile_version=profile_versions[owner_id],
+                    **{"%s_id" % owner_field: owner_id}
+                )
+                for owner_id, by_kind in rankings.items()
+                for kind, ranking in by_kind.items()
+            ]
+        )
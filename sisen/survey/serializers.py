@@ -93,18 +93,6 @@ class AvailableStudySerializer(serializers.Serializer):
     links = LinkSerializer(many=True)
 
 
-class SurveyAnsweringSerializer(serializers.Serializer):
-    description = serializers.CharField(max_length=50)
-    questions = QuestionSerializer(many=True)
-    links = LinkSerializer(many=True)
-
-
-class StudentAnswerSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = models.StudentAnswer
-        fields = '__all__'
-
-
 class StudyOptionScoreSerializer(serializers.Serializer):
     code = serializers.CharField(max_length=50)
     description = serializers.CharField(max_length=100)
@@ -0,0 +1,118 @@
+from django.db.models.signals import pre_save, post_init, post_save, post_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+import sisen.survey.businesses as business
+import sisen.survey.cache as cache
+import sisen.survey.models as models
+import sisen.survey.recommendations as recommendations
+
+
+@receiver([post_save, post_delete], sender=models.Study)
+def study_changed(sender, instance, **kwargs):
+    business.clear_study_caches(instance.id)
+    transaction.on_commit(cache.bump_studies_version)
+
+
+@receiver([post_save, post_delete], sender=models.StudyOption)
+@receiver([post_save, post_delete], sender=models.Question)
+def question_changed(sender, instance, **kwargs):
+    business.clear_study_caches(instance.study_id)
+    transaction.on_commit(cache.bump_studies_version)
+
+
+@receiver([post_save, post_delete], sender=models.Answer)
+def answer_changed(sender, instance, **kwargs):
+    # An answer may be shared by questions of every study
+    business.clear_study_caches()
+    transaction.on_commit(cache.bump_studies_version)
+
+
+@receiver(m2m_changed, sender=models.Answer.questions.through)
+def answer_questions_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        business.clear_study_caches()
+        transaction.on_commit(cache.bump_studies_version)
+
+
+@receiver([post_save, post_delete], sender=models.Study)
+@receiver([post_save, post_delete], sender=models.StudyOption)
+@receiver([post_save, post_delete], sender=models.EducationalType)
+@receiver([post_save, post_delete], sender=models.EducationalProduct)
+@receiver([post_save, post_delete], sender=models.LearningType)
+@receiver([post_save, post_delete], sender=models.LearningMethodology)
+def catalog_changed(sender, **kwargs):
+    # Also makes the stored rankings stale, see recommendations.get_stored_ranking
+    transaction.on_commit(cache.bump_catalog_version)
+
+
+@receiver(m2m_changed, sender=models.EducationalType.styles.through)
+@receiver(m2m_changed, sender=models.EducationalType.intelligences.through)
+@receiver(m2m_changed, sender=models.EducationalProduct.styles.through)
+@receiver(m2m_changed, sender=models.EducationalProduct.intelligences.through)
+@receiver(m2m_changed, sender=models.LearningType.styles.through)
+@receiver(m2m_changed, sender=models.LearningType.intelligences.through)
+@receiver(m2m_changed, sender=models.LearningMethodology.styles.through)
+@receiver(m2m_changed, sender=models.LearningMethodology.intelligences.through)
+def catalog_options_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(cache.bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=models.ProductRating)
+@receiver([post_save, post_delete], sender=models.FavoriteProduct)
+@receiver([post_save, post_delete], sender=models.ProfessorRecommendation)
+def feedback_changed(sender, instance, **kwargs):
+    transaction.on_commit(cache.bump_feedback_version)
+    student_id = getattr(instance, 'student_id', None)
+    if student_id is not None:
+        transaction.on_commit(lambda: cache.bump_student_feedback_version(student_id))
+
+
+@receiver(post_save, sender=models.StudentAnswerLog)
+def study_submitted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        recommendations.invalidate(
+            student_ids=[instance.student_id],
+            class_ids=models.Student.objects.filter(pk=instance.student_id).values_list('sclass_id', flat=True))
+
+
+@receiver(m2m_changed, sender=models.Professor.classes.through)
+def professor_classes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        recommendations.invalidate(professor_ids=(pk_set or ()) if reverse else [instance.pk])
+
+
+@receiver(post_init, sender=models.ClassProduct)
+def class_product_loaded(sender, instance, **kwargs):
+    # The product the row had when loaded, without loading it if deferred
+    instance._loaded_product_id = instance.__dict__.get('product_id')
+
+
+@receiver([post_save, post_delete], sender=models.ClassProduct)
+def class_product_changed(sender, instance, raw=False, **kwargs):
+    product_ids = () if raw else (instance.product_id, instance._loaded_product_id)
+    instance._loaded_product_id = instance.product_id
+    transaction.on_commit(lambda: _class_product_committed(product_ids))
+
+
+def _class_product_committed(product_ids):
+    # In one transaction, so that other processes see the new flags with the new catalog version
+    with transaction.atomic():
+        business.update_class_exclusive(*product_ids)
+        cache.bump_catalog_version()
+
+
+@receiver(pre_save, sender=models.Student)
+def student_class_changing(sender, instance, **kwargs):
+    instance._previous_sclass_id = models.Student.objects.filter(
+        pk=instance.pk).values_list('sclass_id', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=models.Student)
+def student_class_changed(sender, instance, created, raw=False, **kwargs):
+    previous_sclass_id = getattr(instance, '_previous_sclass_id', None)
+    if not raw and not created and previous_sclass_id != instance.sclass_id:
+        business.move_student_class_aggregates(instance.id, previous_sclass_id, instance.sclass_id)
+        transaction.on_commit(lambda: cache.bump_class_versions(previous_sclass_id, instance.sclass_id))
+        transaction.on_commit(lambda: cache.bump_student_version(instance.id))
+        recommendations.invalidate(student_ids=[instance.id], class_ids=[previous_sclass_id, instance.sclass_id])
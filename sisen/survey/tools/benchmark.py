@@ -0,0 +1,194 @@
+# This script measures the latency of hot request paths against the configured database.
+# Every write it performs is rolled back.
+
+import os
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sisen.settings")
+django.setup()
+
+import argparse
+import time
+import uuid
+import numpy as np
+from django.contrib.auth.models import Group, User
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+import sisen.survey.businesses as business
+import sisen.survey.cache as cache
+import sisen.survey.collaborative as collaborative
+import sisen.survey.models as models
+from sisen.survey.products_methodologies import get_product_index, quantize_profile
+from sisen.survey.views.student import process_answer
+
+
+class Rollback(Exception):
+    pass
+
+
+def report(name, latencies, queries=None):
+    latencies = np.array(latencies) * 1000
+    print(
+        f"{name}: {len(latencies)} runs, "
+        f"mean {latencies.mean():.3f} ms, p50 {np.percentile(latencies, 50):.3f} ms, "
+        f"p95 {np.percentile(latencies, 95):.3f} ms"
+        + (f", {np.mean(queries):.0f} queries" if queries is not None else "")
+    )
+
+
+def benchmark_submission(args):
+    """Submits a complete questionnaire as a new student of an existing class, rolling it back."""
+    factory = APIRequestFactory(HTTP_HOST="localhost")
+    study = models.Study.objects.get(id=args.study)
+    sclass = models.Class.objects.first()
+    answers = [
+        {"question": question.id, "answer": question.answers.first().id}
+        for question in study.questions.prefetch_related("answers")
+    ]
+    latencies, queries = [], []
+    for _ in range(args.runs):
+        try:
+            with transaction.atomic():
+                email = f"benchmark-{uuid.uuid4().hex}@sireedu.com.br"
+                user = User.objects.create_user(username=email, email=email)
+                user.groups.add(Group.objects.get(name="Student"))
+                models.Student.objects.create(user=user, sclass=sclass)
+                request = factory.post(
+                    f"/api/v1/survey/study/{study.id}/process", {"answers": answers}, format="json"
+                )
+                force_authenticate(request, user=user)
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = process_answer(request, study.id)
+                    latencies.append(time.perf_counter() - started)
+                queries.append(len(captured))
+                if response.status_code >= 400:
+                    raise SystemExit(f"Submission failed: {response.status_code} {response.data}")
+                raise Rollback()
+        except Rollback:
+            pass
+    report(f"Submission of {len(answers)} answers ({study.acronym})", latencies, queries)
+
+
+def student_profiles(limit):
+    """
+    Returns the profile vectors (product index columns) of up to limit students who answered both
+    studies, leaving out those without stored scores (before backfill_student_scores has run).
+    """
+    index = get_product_index()
+    studies = [business.LEARNING_STYLES_ID, business.INTELLIGENCES_ID]
+    student_ids = list(
+        models.StudentAnswerLog.objects.filter(study__in=studies)
+        .values("student_id")
+        .annotate(studies=Count("study", distinct=True))
+        .filter(studies=len(studies))
+        .values_list("student_id", flat=True)[:limit]
+    )
+    _, profiles = business.student_profiles(student_ids, index.codes)
+    return profiles
+
+
+def benchmark_ranking(args):
+    """Compares the quantized bucket rankings of the products with the exact cosine rankings."""
+    index = get_product_index()
+    profiles = student_profiles(args.runs)
+    if args.random or not len(profiles):
+        profiles = np.random.default_rng(0).random((args.runs, len(index.codes)))
+
+    overlaps, exact_top, buckets = [], 0, set()
+    exact_latencies, bucket_latencies = [], []
+    for profile in profiles:
+        started = time.perf_counter()
+        exact = np.argsort(-index.similarities(profile), kind="stable")
+        exact_latencies.append(time.perf_counter() - started)
+
+        bucket = quantize_profile(profile, args.step)
+        buckets.add(bucket)
+        started = time.perf_counter()
+        quantized = np.argsort(-index.similarities(np.array(bucket, dtype=float)), kind="stable")
+        bucket_latencies.append(time.perf_counter() - started)
+
+        k = min(args.k, len(exact))
+        overlaps.append(len(set(exact[:k]) & set(quantized[:k])) / k if k else 1)
+        exact_top += list(exact[:k]) == list(quantized[:k])
+
+    report("Exact ranking", exact_latencies)
+    report("Bucket ranking (uncached)", bucket_latencies)
+    print(
+        f"{len(profiles)} profiles in {len(buckets)} buckets of step {args.step}, "
+        f"top-{args.k} overlap {np.mean(overlaps):.3f}, identical top-{args.k} {exact_top / len(profiles):.3f}"
+    )
+
+
+def benchmark_collaborative(args):
+    """
+    Measures the latency the collaborative filtering adds to the products of a type of a student:
+    the lookup of the student's interactions and the blend of the term into the cosine scores.
+    Each blend runs as a request, reading the version counters once.
+    """
+    products = list(
+        models.EducationalProduct.objects.filter(type__code__iexact=args.type).values("id")
+    )
+    if not products:
+        raise SystemExit(f"No products of type {args.type}")
+    student_ids = list(
+        models.Student.objects.filter(product_ratings__isnull=False)
+        .distinct()
+        .values_list("id", flat=True)[: args.runs]
+    ) or list(models.Student.objects.values_list("id", flat=True)[: args.runs])
+    scores = np.random.default_rng(0).random(len(products))
+    collaborative.get_neighbor_lists()
+
+    # The first blend of each student queries its interactions, the next ones find them cached
+    latencies = {"cold": [], "warm": []}
+    queries = {"cold": [], "warm": []}
+    for student in models.Student.objects.filter(id__in=student_ids):
+        cache.bump_student_feedback_version(student.id)
+        for run in ("cold", "warm"):
+            items = [
+                dict(product, score=score) for product, score in zip(products, scores.tolist())
+            ]
+            with cache.request_versions(), CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                collaborative.blend_collaborative_scores(items, student)
+                latencies[run].append(time.perf_counter() - started)
+            queries[run].append(len(captured))
+
+    print(
+        f"{len(collaborative.get_neighbor_lists())} products with neighbors, "
+        f"{len(products)} products of type {args.type}"
+    )
+    report("Blend, interactions queried", latencies["cold"], queries["cold"])
+    report("Blend, interactions cached", latencies["warm"], queries["warm"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SIREEDU request paths")
+    parser.add_argument("--runs", "-n", type=int, default=50, help="Number of measured runs")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    submission = subparsers.add_parser("submission", help="Survey submission (process_answer)")
+    submission.add_argument("--study", type=int, default=2, help="Id of the submitted study")
+    submission.set_defaults(func=benchmark_submission)
+
+    ranking = subparsers.add_parser("ranking", help="Quantized vs exact product ranking agreement")
+    ranking.add_argument("--step", type=float, default=0.05, help="Quantization step")
+    ranking.add_argument("-k", type=int, default=10, help="Length of the compared top of the rankings")
+    ranking.add_argument("--random", action="store_true", help="Use random profiles instead of students")
+    ranking.set_defaults(func=benchmark_ranking)
+
+    collaborative_parser = subparsers.add_parser(
+        "collaborative", help="Latency added by the collaborative filtering term"
+    )
+    collaborative_parser.add_argument("--type", default="APPS", help="Code of the product type")
+    collaborative_parser.set_defaults(func=benchmark_collaborative)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,6 @@ from rest_framework.decorators import (
 from sisen.survey.permissions import IsProfessor
 from rest_framework.permissions import IsAuthenticated
 import sisen.survey.models as models
-from sisen.survey.views.main import get_object_or_not_found
-from sisen.survey.views.student import study_answered
 import sisen.survey.businesses as business
 from rest_framework.response import Response
 from sisen.survey.businesses import LEARNING_STYLES_ID, INTELLIGENCES_ID
@@ -25,8 +23,7 @@ def export_survey_csv(request):
 
 def create_csv(save=False):
     exporter = SurveyDataExporter()
-    for student in models.Student.objects.all():
-        exporter.add_student(student)
+    exporter.add_students(models.Student.objects.select_related("user", "sclass"))
     df = exporter.build_dataframe()
 
     if save:
@@ -61,19 +58,8 @@ class SurveyDataExporter:
             "3ª IM mais aflorada": [],
         }
 
-    def _populate_learning_style_scores(self, student):
-        study = get_object_or_not_found(
-            models.Study,
-            LEARNING_STYLES_ID,
-            "O estudo solicitado não existe (ID=%i)" % LEARNING_STYLES_ID,
-        )
-        scores = {}
-        if study_answered(student, study):
-            scores = {
-                obj.code: obj.value
-                for obj in business.process_answer(study, student).study_option_scores
-            }
-        else:
+    def _populate_learning_style_scores(self, scores):
+        if not scores:
             scores = {"ATIVO": 0, "REFLEXIVO": 0, "TEORICO": 0, "PRAGMATICO": 0}
 
         self.data["Ativo (%)"].append(scores["ATIVO"] * 100)
@@ -86,19 +72,8 @@ class SurveyDataExporter:
         self.data["2ª EA mais aflorada"].append(learning_styles[1])
         self.data["3ª EA mais aflorada"].append(learning_styles[2])
 
-    def _populate_intelligence_scores(self, student):
-        study = get_object_or_not_found(
-            models.Study,
-            INTELLIGENCES_ID,
-            "O estudo solicitado não existe (ID=%i)" % INTELLIGENCES_ID,
-        )
-        scores = {}
-        if study_answered(student, study):
-            scores = {
-                obj.code: obj.value
-                for obj in business.process_answer(study, student).study_option_scores
-            }
-        else:
+    def _populate_intelligence_scores(self, scores):
+        if not scores:
             default_keys = [
                 "LOGICA_MATEMATICA",
                 "NATURALISTA",
@@ -127,12 +102,30 @@ class SurveyDataExporter:
         self.data["2ª IM mais aflorada"].append(intelligences[1])
         self.data["3ª IM mais aflorada"].append(intelligences[2])
 
-    def add_student(self, student):
+    def add_students(self, students):
+        student_ids = students.values("id")
+        learning_styles = business.scores_for_students(LEARNING_STYLES_ID, student_ids)
+        intelligences = business.scores_for_students(INTELLIGENCES_ID, student_ids)
+        options = business.get_study_options([LEARNING_STYLES_ID, INTELLIGENCES_ID])
+        for student in students:
+            self.add_student(
+                student,
+                self._student_scores(student, learning_styles, options),
+                self._student_scores(student, intelligences, options),
+            )
+
+    def _student_scores(self, student, study_scores, options):
+        scores, rows, columns = study_scores
+        if student.id not in rows:
+            return {}
+        return business.scores_by_code(scores[rows[student.id]], columns, options)
+
+    def add_student(self, student, learning_style_scores, intelligence_scores):
         self.data["Aluno"].append(student.user.get_full_name())
         self.data["Ano"].append(student.sclass.year)
         self.data["Turma"].append(student.sclass.description)
-        self._populate_learning_style_scores(student)
-        self._populate_intelligence_scores(student)
+        self._populate_learning_style_scores(learning_style_scores)
+        self._populate_intelligence_scores(intelligence_scores)
 
     def build_dataframe(self):
         return DataFrame(self.data)
@@ -43,6 +43,7 @@ urlpatterns = [
     path(r"products/all", recommendation.get_all_educational_products_for_students, name="get_all_educational_products_for_students"),
     path(r"products/student", recommendation.get_student_educational_products, name="get_student_educational_products"),
     path(r"products/professor/<int:class_id>", recommendation.get_professor_educational_products, name="get_professor_educational_products"),
+    path(r"products/professor/<int:class_id>/students", recommendation.get_professor_students_educational_products, name="get_professor_students_educational_products"),
     path(r"products/<str:product_name>", recommendation.get_specific_educational_products, name="get_specific_educational_products"),
     path(r"methodology/professor", recommendation.get_professor_methodology, name="get_professor_methodology"),
     path(r"methodology/all", recommendation.get_all_teaching_methodology, name="get_all_teaching_methodology"),
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import Group
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from rest_framework import status
 from rest_framework.response import Response
 from sisen.survey.exceptions import Conflict, NotFound
@@ -15,49 +16,10 @@ from rest_framework.decorators import (
 
 import sisen.survey.models as models
 
-
-def get_positive_total_rating(product_id):
-    """
-    Get the total rating of a product from the database.
-
-    Parameters:
-    - product (int): The code of the product to get the rating from.
-
-    Returns:
-    - int: The total rating of the product.
-    """
-
-    # the model stores a float nuumber that represents a binary value
-    # 1 means positive rating and 0 means negative rating
-
-    # Count the number of positive ratings for a product
-    positive_rating = models.ProductRating.objects.filter(
-        product=product_id, rating=1
-    ).count()
-
-    return positive_rating
-
-
-def get_negative_total_rating(product_id):
-    """
-    Get the total rating of a product from the database.
-
-    Parameters:
-    - product (int): The code of the product to get the rating from.
-
-    Returns:
-    - int: The total rating of the product.
-    """
-
-    # the model stores a float nuumber that represents a binary value
-    # 1 means positive rating and 0 means negative rating
-
-    # Count the number of negative ratings for a product
-    negative_rating = models.ProductRating.objects.filter(
-        product=product_id, rating=0
-    ).count()
-
-    return negative_rating
+RATING_COUNT_FIELDS = {
+    models.ProductRating.POSITIVE: "pos_rating_count",
+    models.ProductRating.NEGATIVE: "neg_rating_count",
+}
 
 
 @api_view(["POST"])
@@ -99,59 +61,84 @@ def register_rating(request, format=None):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    # Check if the same vote already exists
-    existing_same_rating = models.ProductRating.objects.filter(
-        student=student, product=product, rating=rating_value
-    ).first()
-
-    if existing_same_rating:
+    # Lock the student's rating of the product, if any, until the counters are updated
+    ratings = models.ProductRating.objects.select_for_update().filter(
+        student=student, product=product
+    )
+    existing_rating = ratings.first()
+
+    if existing_rating is None:
+        try:
+            with transaction.atomic():
+                models.ProductRating.objects.create(
+                    student=student, product=product, rating=rating_value
+                )
+        except IntegrityError:
+            # A concurrent request of the student created the rating first: change it instead
+            existing_rating = ratings.first()
+        else:
+            update_rating_counts(product.id, added=rating_value)
+            return Response(
+                {
+                    "detail": "Muito obrigado por sua contribuição. Sua opinião é importante para nós."
+                },
+                status=status.HTTP_201_CREATED,
+            )
+
+    if existing_rating.rating == rating_value:
         # If the same rating already exists, delete it (decrement)
-        existing_same_rating.delete()
+        existing_rating.delete()
+        update_rating_counts(product.id, removed=rating_value)
         return Response(
             {"detail": "Seu voto foi removido com sucesso."},
             status=status.HTTP_200_OK,
         )
 
-    rating, created = models.ProductRating.objects.update_or_create(
-        student=student,
-        product=product,
-        defaults={"rating": rating_value},
+    # Flip the rating
+    update_rating_counts(product.id, added=rating_value, removed=existing_rating.rating)
+    existing_rating.rating = rating_value
+    existing_rating.save()
+    return Response(
+        {"detail": "Seu voto foi alterado com sucesso!"}, status=status.HTTP_200_OK
     )
 
-    if created:
-        return Response(
-            {
-                "detail": "Muito obrigado por sua contribuição. Sua opinião é importante para nós."
-            },
-            status=status.HTTP_201_CREATED,
-        )
-    else:
-        return Response(
-            {"detail": "Seu voto foi alterado com sucesso!"}, status=status.HTTP_200_OK
-        )
+
+def update_rating_counts(product_id, added=None, removed=None):
+    """
+    Increments the rating counter of a product for an added rating value and decrements the one
+    for a removed rating value, atomically in the database.
+    """
+    counts = {}
+    for rating, delta in ((added, 1), (removed, -1)):
+        if rating is not None:
+            field = RATING_COUNT_FIELDS[rating]
+            counts[field] = counts.get(field, F(field)) + delta
+    models.EducationalProduct.objects.filter(id=product_id).update(**counts)
 
 
-def get_user_votes(student, product_type_id, format=None):
+def get_user_votes_by_product(student, product_ids):
     """
-    Get the rating of a product by a student.
+    Get the ratings of the given products by a student, "Positive" or "Negative", by product id.
+    Products the student has not rated are missing.
     """
+    ratings = models.ProductRating.objects.filter(
+        student=student, product__in=product_ids
+    ).values_list("product_id", "rating")
+    return {
+        product_id: "Positive" if rating == models.ProductRating.POSITIVE else "Negative"
+        for product_id, rating in ratings
+    }
 
-    # Check if the user is a student
-    product = get_object_or_not_found(
-        models.EducationalProduct,
-        product_type_id,
-        "O produto especificado não existe (ID=%s)" % product_type_id,
-    )
-    student = student.student
-    query = models.ProductRating.objects.filter(product=product, student=student)
 
-    if query:
-        rating = query.get().rating
-        if rating == models.ProductRating.POSITIVE:
-            return "Positive"
-        else:
-            return "Negative"
-    return None
+def get_rating_totals(product_ids):
+    """
+    Get the (positive, negative) rating totals of the given products from their counters, by
+    product id. Missing products are missing.
+    """
+    totals = models.EducationalProduct.objects.filter(id__in=product_ids).values_list(
+        "id", "pos_rating_count", "neg_rating_count"
+    )
+    return {product_id: (positive, negative) for product_id, positive, negative in totals}
 
 
 # ================================================ #
@@ -222,55 +209,16 @@ def register_recommendation_professor_to_student(request, format=None):
     )
 
 
-def get_if_professor_recommended(professor, product_type_id):
+def get_recommended_product_ids(class_obj, product_ids):
     """
-    Get the recommendations of a professor to a student.
+    Get the ids of the given products recommended by a professor to a class.
     """
-
-    product = get_object_or_not_found(
-        models.EducationalProduct,
-        product_type_id,
-        "O produto especificado não existe (ID=%s)" % product_type_id,
-    )
-
-    class_id = professor.professor.classes.all().first().id
-
-    class_obj = get_object_or_not_found(
-        models.Class,
-        class_id,
-        "A turma especificada não existe (ID=%s)" % class_id,
-    )
-
-    query = models.ProfessorRecommendation.objects.filter(
-        product=product, class_id=class_obj
+    return set(
+        models.ProfessorRecommendation.objects.filter(
+            class_id=class_obj, product__in=product_ids
+        ).values_list("product_id", flat=True)
     )
 
-    if query:
-        return True
-    return False
-
-
-def get_professors_to_student_recommendations(student, product_type_id):
-    """
-    Get the recommendations of a professor to a student.
-    """
-
-    product = get_object_or_not_found(
-        models.EducationalProduct,
-        product_type_id,
-        "O produto especificado não existe (ID=%s)" % product_type_id,
-    )
-
-    class_obj = student.student.sclass
-
-    query = models.ProfessorRecommendation.objects.filter(
-        product=product, class_id=class_obj
-    )
-
-    if query:
-        return True
-    return False
-
 
 # ================================================ #
 # ==== Favorite Product Register ==== #
@@ -333,19 +281,12 @@ def register_favorite(request, format=None):
     )
 
 
-def get_if_student_favorite(student, product_type_id):
+def get_favorite_product_ids(student, product_ids):
     """
-    Get the favorite of a student.
+    Get the ids of the given products marked as favorite by a student.
     """
-
-    product = get_object_or_not_found(
-        models.EducationalProduct,
-        product_type_id,
-        "O produto especificado não existe (ID=%s)" % product_type_id,
+    return set(
+        models.FavoriteProduct.objects.filter(
+            student=student, product__in=product_ids
+        ).values_list("product_id", flat=True)
     )
-
-    query = models.FavoriteProduct.objects.filter(student=student, product=product)
-
-    if query:
-        return True
-    return False
@@ -7,42 +7,109 @@ from rest_framework.response import Response
 from sisen.survey.exceptions import Conflict
 from sisen.survey.permissions import IsStudent, IsStudentOrProfessor, IsProfessor
 from random import sample
+from copy import deepcopy
+from django.conf import settings
 from sisen.survey.products_methodologies import (
     get_methodology_by_name,
     get_products,
     get_methodologies,
     get_specific_methodologies_by_scores,
-    find_value_by_description2,
-    get_specific_products,
+    get_specific_methodologies,
+    get_learning_types_sorted_by_scores,
+    get_specific_product_rows,
+    get_products_by_id,
     add_score_to_methodology,
     get_products_sorted_by_similarity_score,
+    get_products_from_ranking,
+    sort_by_ranking,
+    get_type_index,
+    get_product_index,
+    get_recommended_products,
+    get_recommended_products_for_profiles,
+    get_ranking_context,
+    recommended_count,
 )
 import sisen.survey.models as models
 from sisen.survey.views.main import get_object_or_not_found
 import sisen.survey.businesses as business
 from sisen.survey.businesses import LEARNING_STYLES_ID, INTELLIGENCES_ID
-from sisen.survey.views.student import study_answered_or_error, study_answered
+from sisen.survey.views.student import study_answered_or_error
 from django.db.models import Avg
 from sisen.survey.views.product_rating import (
-    get_user_votes,
-    get_professors_to_student_recommendations,
-    get_if_professor_recommended,
-    get_if_student_favorite,
+    get_user_votes_by_product,
+    get_recommended_product_ids,
+    get_favorite_product_ids,
 )
+from sisen.survey.views.student import submission_etag
 from rest_framework.pagination import LimitOffsetPagination
-from math import ceil
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+import sisen.survey.cache as cache
+import sisen.survey.recommendations as recommendations
+from sisen.survey.collaborative import blend_collaborative_scores
+
+STUDY_IDS = [LEARNING_STYLES_ID, INTELLIGENCES_ID]
+
+# Per-student rankings keyed by _recommendation_key
+_recommendation_cache = cache.LRUCache(settings.RECOMMENDATION_CACHE_SIZE)
+
+
+def _student_products_etag(request, *args, **kwargs):
+    return submission_etag(
+        request, STUDY_IDS, cache.get_scores_version(), cache.get_catalog_version()
+    )
+
+
+def _student_specific_products_etag(request, *args, **kwargs):
+    student = getattr(request.user, "student", None)
+    if student is None:
+        return None
+    # The student version changes with the class, which selects the class products
+    return submission_etag(
+        request,
+        STUDY_IDS,
+        cache.get_student_version(student.id),
+        cache.get_scores_version(),
+        cache.get_catalog_version(),
+        cache.get_feedback_version(),
+        cache.get_neighbors_version(),
+    )
 
 
 @api_view(["GET"])
 @permission_classes((IsAuthenticated, IsStudent))
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_student_products_etag)
 def get_student_educational_products(request):
     """
     Retrieve educational products recommended for a student based on their scores for learning styles and intelligences.
     Use the student's scores to calculate the similarity between the student and the educational products.
     """
-    student_score = []
     student = request.user.student
-    for study_id in [LEARNING_STYLES_ID, INTELLIGENCES_ID]:
+    key = _recommendation_key(student, None)
+    selected_products = _recommendation_cache.get(key)
+    if selected_products is None:
+        ranking = recommendations.get_stored_ranking(recommendations.TYPES, student=student)
+        if ranking is not None:
+            selected_products = get_products_from_ranking(
+                ranking[: recommended_count(len(ranking))]
+            )
+        else:
+            selected_products = get_recommended_products(get_student_score_by_code(student))
+        _recommendation_cache.set(key, selected_products)
+
+    return Response({"selectedProducts": deepcopy(selected_products)})
+
+
+def get_student_score_by_code(student):
+    """
+    Returns the student's scores by option code of both studies.
+
+    Raises:
+    - Conflict: If the student has not answered one of the studies
+    """
+    student_score = []
+    for study_id in STUDY_IDS:
         study = get_object_or_not_found(
             models.Study, study_id, "O estudo solicitado não existe (ID=%i)" % study_id
         )
@@ -54,91 +121,49 @@ def get_student_educational_products(request):
 
     student_score_by_code = {obj.code: obj.value for obj in styles_score}
     student_score_by_code.update({obj.code: obj.value for obj in intelligences_score})
-
-    products_list = get_products_sorted_by_similarity_score(
-        student_score_by_code, get_products()
+    return student_score_by_code
+
+
+def _recommendation_key(student, product_type):
+    # The student version changes on submission and class change, the scores version when the
+    # stored scores are recalculated and the catalog version on any change of products, types or
+    # class products, so stale entries are never hit again
+    return (
+        student.id,
+        cache.get_student_version(student.id),
+        cache.get_scores_version(),
+        cache.get_catalog_version(),
+        product_type and product_type.casefold(),
     )
 
-    # get all educational products with score greater than 0.85
-    products_sorted_by_score = sorted(
-        products_list, key=lambda x: x["score"], reverse=True
-    )
-    selected_products = [
-        product for product in products_sorted_by_score if product["score"] > 0.85
-    ]
 
-    # The amount of recommended products is determined by the total number of products.
-    recommended_count = ceil(0.5 * len(products_sorted_by_score) - 0.5)
-
-    # If there are not enough highly scored products, take the top products overall.
-    if len(selected_products) < recommended_count:
-        selected_products = products_sorted_by_score[:recommended_count]
-    else:
-        selected_products = selected_products[:recommended_count]
-
-    return Response({"selectedProducts": selected_products})
-
-
-# TODO - Refactor this function to use the new similarity score calculation
 def generate_teaching_methodology_score_for_professor(request):
-    styles_score = {}
-    intelligences_score = {}
-    total_students = 0
-    for sclass in request.user.professor.classes.all():
-        for student in sclass.students.all():
-            student_score = {}
-            for study_id in [LEARNING_STYLES_ID, INTELLIGENCES_ID]:
-                study = get_object_or_not_found(
-                    models.Study,
-                    study_id,
-                    "O estudo solicitado não existe (ID=%i)" % study_id,
-                )
-                if study_answered(student, study):
-                    student_score[study_id] = business.process_answer(study, student)
-
-            # Check if the student has answered the study for Learning Styles and Intelligences
-            if len(student_score) == 2:
-                if total_students == 0:  # First student
-                    styles_score = {
-                        obj.code: obj.value
-                        for obj in student_score[LEARNING_STYLES_ID].study_option_scores
-                    }
-                    intelligences_score = {
-                        obj.code: obj.value
-                        for obj in student_score[INTELLIGENCES_ID].study_option_scores
-                    }
-                else:
-                    # Sum the scores for each student
-                    for obj in student_score[LEARNING_STYLES_ID].study_option_scores:
-                        styles_score[obj.code] += obj.value
-                    for obj in student_score[INTELLIGENCES_ID].study_option_scores:
-                        intelligences_score[obj.code] += obj.value
-
-                total_students += 1
-    
+    """
+    Returns the (name, score) pairs of every teaching methodology sorted by score for the students
+    of the classes of the logged professor, or with score 0 if no student has answered both studies.
+    """
+    professor = request.user.professor
+    ranking = recommendations.get_stored_ranking(
+        recommendations.METHODOLOGIES, professor=professor
+    )
+    if ranking is None:
+        profile = business.ClassProfile.for_classes(
+            professor.classes.values_list("id", flat=True)
+        )
+        if profile.answered_count > 0:
+            ranking = get_learning_types_sorted_by_scores(profile.total_by_code)
+
     methodologies = all_teaching_methodology()
-    recommendation = []
-    if total_students > 0:
-        for methodology in methodologies:
-            score = 0
-            total_features = len(methodology["learning_intelligences"]) + len(
-                methodology["learning_styles"]
-            )
-            for intelligence in methodology["learning_intelligences"]:
-                score += (
-                    find_value_by_description2(intelligences_score, intelligence)
-                    / total_features
-                )
-
-            for style in methodology["learning_styles"]:
-                score += find_value_by_description2(styles_score, style) / total_features
-            recommendation.append((methodology["name"], score / 100))
-        recommendation.sort(
-            key=lambda x: x[1], reverse=True
-        )  # Ordenar produtos por pontuação decrescente
-        return recommendation
-    
+    if ranking is not None:
+        names_by_id = {methodology["id"]: methodology["name"] for methodology in methodologies}
+        return [
+            (names_by_id[learning_type_id], score)
+            for learning_type_id, score in ranking
+            if learning_type_id in names_by_id
+        ]
+
     # if there are no students, return the list of educational products without scores
+    recommendation = []
     for methodology in methodologies:
         methodology["score"] = 0
         recommendation.append((methodology["name"], 0))
@@ -158,10 +183,44 @@ def generate_educational_products_score_for_professor(request, class_id):
     Raises:
     - Conflict: If there are not enough students to calculate style and intelligence scores
     """
-    styles_score = {}
-    intelligences_score = {}
-    total_students = 0
+    selected_class = get_professor_class(request, class_id)
+    ranking = recommendations.get_stored_ranking(recommendations.TYPES, sclass=selected_class)
+    if ranking is not None:
+        return sort_by_ranking(get_products(class_id), ranking)
+
+    student_score_by_code = get_class_score_by_code(selected_class)
+
+    # Check if no student has answered the study for Learning Styles or Intelligences
+    if student_score_by_code is not None:
+        products_list = get_products_sorted_by_similarity_score(
+            student_score_by_code, get_products(class_id), get_type_index()
+        )
     
+        return products_list    
+
+    return get_products_without_score(class_id)
+
+
+def get_class_score_by_code(selected_class):
+    """
+    Returns the mean scores by option code of the students of a class who answered both studies,
+    or None if no student has.
+    """
+    profile = business.ClassProfile.for_classes([selected_class.id])
+    if profile.answered_count == 0:
+        return None
+
+    return profile.mean_by_code
+
+
+def get_professor_class(request, class_id):
+    """
+    Returns the class of the given id if it belongs to the logged professor.
+
+    Raises:
+    - NotFound: If the class does not exist
+    - Conflict: If the class does not belong to the logged professor
+    """
     selected_class = get_object_or_not_found(
         models.Class,
         class_id,
@@ -169,51 +228,10 @@ def generate_educational_products_score_for_professor(request, class_id):
     )
     if selected_class not in request.user.professor.classes.all():
         raise Conflict("A turma solicitada não pertence ao professor logado.")
-    
-    for student in selected_class.students.all():
-        student_score = {}
-        for study_id in [LEARNING_STYLES_ID, INTELLIGENCES_ID]:
-            study = get_object_or_not_found(
-                models.Study,
-                study_id,
-                "O estudo solicitado não existe (ID=%i)" % study_id,
-            )
-            if study_answered(student, study):
-                student_score[study_id] = business.process_answer(study, student)
-
-        # Check if the student has answered the study for Learning Styles and Intelligences
-        if len(student_score) == 2:
-            if total_students == 0:  # First student
-                styles_score = {
-                    obj.code: obj.value
-                    for obj in student_score[LEARNING_STYLES_ID].study_option_scores
-                }
-                intelligences_score = {
-                    obj.code: obj.value
-                    for obj in student_score[INTELLIGENCES_ID].study_option_scores
-                }
-            else:
-                # Sum the scores for each student
-                for obj in student_score[LEARNING_STYLES_ID].study_option_scores:
-                    styles_score[obj.code] += obj.value
-                for obj in student_score[INTELLIGENCES_ID].study_option_scores:
-                    intelligences_score[obj.code] += obj.value
-
-            total_students += 1
-
-    # Check if no student has answered the study for Learning Styles or Intelligences
-    if total_students > 0:
-        student_score_by_code = dict(styles_score, **intelligences_score)
-
-        for key in student_score_by_code:
-            student_score_by_code[key] = student_score_by_code[key] / total_students
+    return selected_class
 
-        products_list = get_products_sorted_by_similarity_score(
-            student_score_by_code, get_products(class_id)
-        )
-    
-        return products_list    
 
+def get_products_without_score(class_id):
     # if there are no students, return the list of educational products without scores
     products_list = sorted(get_products(class_id), key=lambda x: x["name"])
     for product in products_list:
@@ -237,23 +255,51 @@ def get_professor_educational_products(request, class_id):
     Raises:
     - Conflict: If there are not enough students to calculate style and intelligence scores
     """
-    recommendation = generate_educational_products_score_for_professor(request, class_id)
+    selected_class = get_professor_class(request, class_id)
+    ranking = recommendations.get_stored_ranking(recommendations.TYPES, sclass=selected_class)
+    student_score_by_code = get_class_score_by_code(selected_class) if ranking is None else None
+
+    if ranking is not None:
+        selected_products = get_products_from_ranking(ranking[: recommended_count(len(ranking))])
+    elif student_score_by_code is not None:
+        selected_products = get_recommended_products(student_score_by_code)
+    else:
+        products_list = get_products_without_score(class_id)
+        selected_products = products_list[: recommended_count(len(products_list))]
 
-    # get all educational products with score greater than 0.75]
-    selected_products = [
-        product for product in recommendation if product["score"] > 0.85
-    ]
+    return Response({"selectedProducts": selected_products})
 
-    # The amount of recommended products is determined by the total number of products.
-    recommended_count = ceil(0.5 * len(recommendation) - 0.5)
 
-    # If there are not enough highly scored products, take the top products overall.
-    if len(selected_products) < recommended_count:
-        selected_products = recommendation[:recommended_count]
-    else:
-        selected_products = selected_products[:recommended_count]
+@api_view(["GET"])
+@permission_classes((IsAuthenticated, IsProfessor))
+def get_professor_students_educational_products(request, class_id):
+    """
+    Retrieve the educational products recommended to each student of a class of the professor who
+    has answered both studies, paginated over the students (sorted by id). The page of students is
+    scored against every product with a single matrix product.
+    """
+    selected_class = get_professor_class(request, class_id)
+    student_ids, profiles, users = business.class_student_profiles(
+        selected_class.id, get_type_index().codes
+    )
 
-    return Response({"selectedProducts": selected_products})
+    paginator = LimitOffsetPagination()
+    paginated_rows = paginator.paginate_queryset(list(range(len(student_ids))), request)
+    rows = paginated_rows if paginated_rows is not None else list(range(len(student_ids)))
+
+    students = [
+        dict(users[row], id=student_ids[row], selectedProducts=selected_products)
+        for row, selected_products in zip(
+            rows, get_recommended_products_for_profiles(profiles[rows])
+        )
+    ]
+
+    if paginated_rows is not None:
+        response = paginator.get_paginated_response(students)
+        response.data["students"] = response.data.pop("results")
+        return response
+
+    return Response({"students": students})
 
 
 @api_view(["GET"])
@@ -273,6 +319,8 @@ def all_educational_products():
 
 @api_view(["GET"])
 @permission_classes((IsAuthenticated, IsStudentOrProfessor))
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_student_specific_products_etag)
 def get_specific_educational_products(request, product_name):
     """
     Retrieve specific educational products based on the user's scores and preferences.
@@ -305,116 +353,82 @@ def get_specific_educational_products(request, product_name):
         if hasattr(request.user, 'student') and request.user.student.sclass:
             class_obj = request.user.student.sclass
 
-    if request.user and request.user.groups.filter(name__in=["Professor"]):
-        styles_score = {}
-        intelligences_score = {}
-        total_students = 0
-        
+    # --- 2. RANK THE COMPACT PRODUCT ROWS ---
+    # Products are ranked, filtered, sorted and paginated as "id", "name" and "info" rows,
+    # only the page is turned into full product dicts with the per-user overlays
+    is_professor = request.user and request.user.groups.filter(name__in=["Professor"])
+    product_rows = get_specific_product_rows(
+        product_name, class_obj if is_professor else request.user.student.sclass
+    )
+
+    if is_professor:
         # Calculate scores based on the specific class context if available
-        target_classes = [class_obj] if class_obj else request.user.professor.classes.all()
-
-        for sclass in target_classes:
-            for student in sclass.students.all():
-                student_score = {}
-                for study_id in [LEARNING_STYLES_ID, INTELLIGENCES_ID]:
-                    study = get_object_or_not_found(
-                        models.Study,
-                        study_id,
-                        "O estudo solicitado não existe (ID=%i)" % study_id,
-                    )
-                    if study_answered(student, study):
-                        student_score[study_id] = business.process_answer(
-                            study, student
-                        )
-
-                # Check if the student has answered the study for Learning Styles and Intelligences
-                if len(student_score) == 2:
-                    if total_students == 0:
-                        styles_score = {
-                            obj.code: obj.value
-                            for obj in student_score[
-                                LEARNING_STYLES_ID
-                            ].study_option_scores
-                        }
-                        intelligences_score = {
-                            obj.code: obj.value
-                            for obj in student_score[
-                                INTELLIGENCES_ID
-                            ].study_option_scores
-                        }
-                    else:
-                        for obj in student_score[
-                            LEARNING_STYLES_ID
-                        ].study_option_scores:
-                            styles_score[obj.code] += obj.value
-                        for obj in student_score[INTELLIGENCES_ID].study_option_scores:
-                            intelligences_score[obj.code] += obj.value
-
-                    total_students += 1
-
-        if total_students > 0:
-            student_score_by_code = dict(styles_score, **intelligences_score)
-
-            for key in student_score_by_code:
-                student_score_by_code[key] = student_score_by_code[key] / total_students
-
-            # --- PASS CLASS OBJECT HERE ---
+        target_classes = (
+            [class_obj.id]
+            if class_obj
+            else request.user.professor.classes.values_list("id", flat=True)
+        )
+
+        # The stored ranking of the class, or of every class of the professor
+        ranking = recommendations.get_stored_ranking(
+            recommendations.products_kind(product_name),
+            sclass=class_obj,
+            professor=None if class_obj else request.user.professor,
+        )
+        profile = business.ClassProfile.for_classes(target_classes) if ranking is None else None
+
+        if ranking is not None:
+            specific_product_list = sort_by_ranking(product_rows, ranking)
+        elif profile.answered_count > 0:
             specific_product_list = get_products_sorted_by_similarity_score(
-                student_score_by_code, get_specific_products(product_name, class_obj)
+                profile.mean_by_code, product_rows, get_product_index()
             )
         else:
-            # --- PASS CLASS OBJECT HERE TOO ---
-            specific_product_list = sorted(get_specific_products(product_name, class_obj), key=lambda x: x["name"])
+            specific_product_list = sorted(product_rows, key=lambda x: x["name"])
             for product in specific_product_list:
                 product["score"] = 0
 
-        for product in specific_product_list:
-            product["professor_recommendation"] = get_if_professor_recommended(
-                request.user, product["id"]
-            )
-
     # if the user is a student
     else:
-        student_score = []
         student = request.user.student
-        for study_id in [LEARNING_STYLES_ID, INTELLIGENCES_ID]:
-            study = get_object_or_not_found(
-                models.Study,
-                study_id,
-                "O estudo solicitado não existe (ID=%i)" % study_id,
-            )
-            study_answered_or_error(student, study)
-            student_score.append(business.process_answer(study, student))
-        styles_score = student_score[0].study_option_scores
-        intelligences_score = student_score[1].study_option_scores
-
-        recommendation = {obj.code: obj.value for obj in styles_score}
-        recommendation.update({obj.code: obj.value for obj in intelligences_score})
-
-        specific_product_list = get_products_sorted_by_similarity_score(
-            recommendation, get_specific_products(product_name, request.user.student.sclass)
-        )
-
-        for product in specific_product_list:
-            # get if the user has voted for these educational products
-            product["user_vote"] = get_user_votes(request.user, product["id"])
 
-            # get if the professor has recommended these educational products
-            product["professor_recommendation"] = (
-                get_professors_to_student_recommendations(request.user, product["id"])
+        # Only the ranking is cached, the products carry ratings that change independently
+        key = _recommendation_key(student, product_name)
+        ranking = _recommendation_cache.get(key)
+        if ranking is None:
+            ranking = recommendations.get_stored_ranking(
+                recommendations.products_kind(product_name), student=student
             )
+            if ranking is not None:
+                _recommendation_cache.set(key, ranking)
+        if ranking is None:
+            specific_product_list = get_products_sorted_by_similarity_score(
+                get_student_score_by_code(student),
+                product_rows,
+                get_product_index(),
+                get_ranking_context(product_name, student.sclass),
+            )
+            _recommendation_cache.set(
+                key, [(product["id"], product["score"]) for product in specific_product_list]
+            )
+        else:
+            specific_product_list = sort_by_ranking(product_rows, ranking)
 
-            # get if the student has marked these educational products as favorites
-            product["favorite"] = get_if_student_favorite(request.user.student, product["id"])
+        # The ranking is by profile only, the student's ratings and favorites move it afterwards
+        specific_product_list = blend_collaborative_scores(specific_product_list, student)
 
     for i, product in enumerate(specific_product_list):
         product["relevance"] = i + 1
-    
+
+    # --- 3. FILTER, SORT AND PAGINATE ---
     favorites_only = request.query_params.get('favorites_only') == 'true'
 
-    if favorites_only and not request.user.groups.filter(name__in=["Professor"]):
+    if favorites_only and not is_professor:
+        favorite_ids = get_favorite_product_ids(
+            request.user.student, [p["id"] for p in specific_product_list]
+        )
         specific_product_list = [
-            p for p in specific_product_list if p.get('favorite') is True
+            p for p in specific_product_list if p["id"] in favorite_ids
         ]
 
     search_term = request.query_params.get('search', None)
@@ -433,7 +447,7 @@ def get_specific_educational_products(request, product_name):
     if sort_by == 'rating':
         # Sort by net rating (positive votes - negative votes) in descending order
         specific_product_list.sort(
-            key=lambda p: p.get('pos_rating', 0) - p.get('neg_rating', 0),
+            key=lambda p: p["pos_rating_count"] - p["neg_rating_count"],
             reverse=True
         )
     elif sort_by == "alphabetical": # 'default' sort
@@ -446,15 +460,62 @@ def get_specific_educational_products(request, product_name):
     # The 'paginate_queryset' method handles the slicing based on 'limit' and 'offset' query params
     paginated_product_list = paginator.paginate_queryset(specific_product_list, request)
 
+    # --- 4. HYDRATE THE PAGE ---
+    page = hydrate_products(
+        request,
+        paginated_product_list if paginated_product_list is not None else specific_product_list,
+        is_professor,
+    )
+
     # The 'get_paginated_response' method formats the response with 'count', 'next', 'previous', and 'results'
     if paginated_product_list is not None:
         # Note: The data is now in a 'results' key inside the response
-        response = paginator.get_paginated_response(paginated_product_list)
+        response = paginator.get_paginated_response(page)
         response.data['specificProducts'] = response.data.pop('results') # Rename 'results' to 'specificProducts'
 
         return response
 
-    return Response({"specificProducts": specific_product_list})
+    return Response({"specificProducts": page})
+
+
+def hydrate_products(request, product_rows, is_professor):
+    """
+    Returns the full dicts of the given ranked product rows, keeping their "score" and "relevance",
+    with the overlays of the requesting professor or student fetched in bulk for their ids.
+    """
+    product_ids = [row["id"] for row in product_rows]
+    products_by_id = get_products_by_id(product_ids)
+    products = []
+    for row in product_rows:
+        product = products_by_id[row["id"]]
+        product["score"] = row["score"]
+        products.append(product)
+
+    if is_professor:
+        recommended_ids = get_recommended_product_ids(
+            request.user.professor.classes.all().first(), product_ids
+        )
+        for product in products:
+            product["professor_recommendation"] = product["id"] in recommended_ids
+    else:
+        student = request.user.student
+        votes = get_user_votes_by_product(student, product_ids)
+        recommended_ids = get_recommended_product_ids(student.sclass, product_ids)
+        favorite_ids = get_favorite_product_ids(student, product_ids)
+        for product in products:
+            # get if the user has voted for these educational products
+            product["user_vote"] = votes.get(product["id"])
+
+            # get if the professor has recommended these educational products
+            product["professor_recommendation"] = product["id"] in recommended_ids
+
+            # get if the student has marked these educational products as favorites
+            product["favorite"] = product["id"] in favorite_ids
+
+    for row, product in zip(product_rows, products):
+        product["relevance"] = row["relevance"]
+    return products
+
 
 
 @api_view(["GET"])
@@ -513,45 +574,38 @@ def all_teaching_methodology():
 @api_view(["GET"])
 @permission_classes((IsAuthenticated, IsProfessor))
 def get_specific_teaching_methodology(request, methodology_name):
-    # Send a response with error saying that this api doesnt work for now
-
-    return Conflict("This API is not working for now.")
-
     """
-    Retrieve a list of specific teaching methodologies along with their information and links.
+    Retrieve a list of specific teaching methodologies along with their information and links,
+    sorted by similarity to the students of the classes of the logged professor.
     Parameters:
     - request: Request object
     - methodology_name: Name of the teaching methodology
     Returns:
     - Response containing a list of dictionaries with keys 'name', 'info', and 'link' for each specific methodology.
     """
-    average_scores = {}
-    for sclass in request.user.professor.classes.all():
-        total_students = len(sclass.students.all())
-        for student in sclass.students.all():
-            if study_answered(student, LEARNING_STYLES_ID):
-                student_score = business.process_answer(LEARNING_STYLES_ID, student)
-
-                for row in student_score.study_option_scores:
-                    if row.code not in average_scores:
-                        average_scores[row.code] = 0
-                    average_scores[row.code] += row.value / total_students
-
-    # if any of the scores is None, set it to 0
-    average_scores = {
-        key: value if value is not None else 0 for key, value in average_scores.items()
-    }
-
-    sorted_average_scores = sorted(
-        average_scores.items(), key=lambda item: item[1], reverse=True
+    professor = request.user.professor
+    ranking = recommendations.get_stored_ranking(
+        recommendations.methodologies_kind(methodology_name), professor=professor
     )
-
-    sorted_styles = []
-    for item in sorted_average_scores:
-        sorted_styles.append(item[0])
-
-    specific_methodology_list = get_specific_methodologies_by_scores(
-        sorted_styles, methodology_name
+    profile = (
+        business.ClassProfile.for_classes(professor.classes.values_list("id", flat=True))
+        if ranking is None
+        else None
     )
 
-    return Response({"specificMethodology": specific_methodology_list})
\ No newline at end of file
+    if ranking is not None:
+        specific_methodology_list = sort_by_ranking(
+            get_specific_methodologies(methodology_name), ranking
+        )
+    elif profile.answered_count > 0:
+        specific_methodology_list = get_specific_methodologies_by_scores(
+            profile.mean_by_code, methodology_name
+        )
+    else:
+        specific_methodology_list = sorted(
+            get_specific_methodologies(methodology_name), key=lambda x: x["name"]
+        )
+        for methodology in specific_methodology_list:
+            methodology["score"] = 0
+
+    return Response({"specificMethodology": specific_methodology_list})
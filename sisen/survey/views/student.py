@@ -1,19 +1,27 @@
 from django.contrib.auth.models import Group
 from django.db import transaction
 from django.db.models import F, Sum
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import redirect, get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from hashlib import sha1
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
 import sisen.survey.businesses as business
+import sisen.survey.cache as cache
 import sisen.survey.models as models
-from sisen.survey.dto import Link, AvailableStudy, SurveyAnswering
-from sisen.survey.exceptions import Conflict, NotFound
+from sisen.survey.dto import Link, AvailableStudy
+from sisen.survey.exceptions import BadRequest, Conflict, NotFound
 from sisen.survey.permissions import IsStudent
-from sisen.survey.serializers import AvailableStudySerializer, SurveyAnsweringSerializer, StudentAnswerSerializer, \
+from sisen.survey.serializers import AvailableStudySerializer, LinkSerializer, \
     StudyWithMessageAndStudentOptionScoreSerializer
 from sisen.survey.serializers import UserSerializer, StudentSerializer
 from sisen.survey.views.main import get_object_or_not_found
@@ -142,11 +150,23 @@ def answer(request, study_id, format=None):
     student = request.user.student
     study_not_answered_or_error(student, study)
 
-    survey_answering = SurveyAnswering(study.description, study.questions.all(), [])
-    survey_answering.links.append(Link('self', reverse('answer', args=[study_id], request=request)))
-    survey_answering.links.append(Link('home', reverse('student_home', request=request)))
-    survey_answering.links.append(Link('process', reverse('process_answer', args=[study_id], request=request), 'POST'))
-    return Response(SurveyAnsweringSerializer(survey_answering).data)
+    payload, etag = business.questionnaire_payload(study)
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        links = [
+            Link('self', reverse('answer', args=[study_id], request=request)),
+            Link('home', reverse('student_home', request=request)),
+            Link('process', reverse('process_answer', args=[study_id], request=request), 'POST'),
+        ]
+        # Splices the links into the precompiled questionnaire object
+        response = HttpResponse(
+            payload[:-1] + b',"links":' + JSONRenderer().render(LinkSerializer(links, many=True).data) + b'}',
+            content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @api_view(['POST'])
@@ -159,19 +179,51 @@ def process_answer(request, study_id, format=None):
     study_not_answered_or_error(student, study)
 
     answers = list(filter(lambda e: e != None, request.data.get('answers', [])))
-    validate_answers(study, answers)
-    for answer in answers:
-        answer.update({ 'study': study.id, 'student': student.id })
-    serializer = StudentAnswerSerializer(data=answers, many=True)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    serializer.save()
+    answer_id_by_question = validate_answers(study, answers)
+    models.StudentAnswer.objects.bulk_create([
+        models.StudentAnswer(student=student, study=study, question_id=question_id, answer_id=answer_id)
+        for question_id, answer_id in answer_id_by_question.items()
+    ])
+    # Registered before the log is saved, which queues the precomputation of the rankings
+    transaction.on_commit(lambda: cache.bump_class_versions(student.sclass_id))
+    transaction.on_commit(lambda: cache.bump_student_version(student.id))
     models.StudentAnswerLog(student=student, study=study).save()
+    scores, rows, columns = business.store_scores_for_students(study, [student.id])
+    business.update_class_aggregates(study, student.sclass_id, scores, columns)
     return redirect('survey_report', study_id=study.id)
 
 
+def submission_etag(request, study_ids, *versions):
+    """
+    ETag of a response computed from the requesting student's submissions of the given studies and
+    the given versions, or None when the user is not a student or has not submitted every study.
+    """
+    submitted = _submission_datetimes(request)
+    if not all(study_id in submitted for study_id in study_ids):
+        return None
+    key = [request.user.student.id, request.get_full_path()]
+    key.extend(submitted[study_id].isoformat() for study_id in study_ids)
+    key.extend(versions)
+    return sha1(repr(key).encode()).hexdigest()
+
+
+def _submission_datetimes(request):
+    # { study_id: submit_datetime } of the requesting student, memoized on the request
+    if not hasattr(request, '_submission_datetimes'):
+        student = getattr(request.user, 'student', None)
+        request._submission_datetimes = dict(models.StudentAnswerLog.objects.filter(
+            student=student).values_list('study_id', 'submit_datetime')) if student else {}
+    return request._submission_datetimes
+
+
+def _survey_report_etag(request, study_id, format=None):
+    return submission_etag(request, [study_id], cache.get_scores_version(), cache.get_catalog_version())
+
+
 @api_view(['GET'])
 @permission_classes((IsAuthenticated, IsStudent))
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_survey_report_etag)
 def survey_report(request, study_id, format=None):
     study = get_object_or_not_found(models.Study, study_id,
         'O estudo solicitado não existe (ID=%i)' % study_id)
@@ -194,13 +246,26 @@ def study_answered_or_error(student, study):
         raise Conflict('O estudo \'%s\' ainda não foi respondido' % study.description)
 
 
-def study_answered(student, study):
-    return models.StudentAnswer.objects.filter(student=student, study=study).exists()
-
-
 def validate_answers(study, answers):
-    # TODO: Should also validate the answers of each question?
-    expected = set(map(lambda s: s.id, study.questions.all()))
-    received = set(map(lambda s: s.get('question'), answers))
-    if len(expected - received) != 0:
+    """
+    Validates every question and answer id of a submission in one pass against the cached ids of
+    the study. Returns a dict mapping each question id to the id of its answer.
+    """
+    answer_ids = business.get_study_answer_ids(study)
+    answer_id_by_question = {}
+    for answer in answers:
+        try:
+            question_id = int(answer.get('question'))
+            answer_id = int(answer.get('answer'))
+        except (AttributeError, TypeError, ValueError):
+            raise BadRequest('Cada resposta deve informar os ids da questão e da resposta escolhida')
+        if question_id not in answer_ids:
+            raise BadRequest('A questão %s não pertence ao estudo \'%s\'' % (question_id, study.description))
+        if answer_id not in answer_ids[question_id]:
+            raise BadRequest('A resposta %s não é válida para a questão %s' % (answer_id, question_id))
+        if question_id in answer_id_by_question:
+            raise BadRequest('A questão %s foi respondida mais de uma vez' % question_id)
+        answer_id_by_question[question_id] = answer_id
+    if len(answer_id_by_question) != len(answer_ids):
         raise Conflict('Todas as questões do estudo devem ser respondidas')
+    return answer_id_by_question